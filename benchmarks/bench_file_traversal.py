@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of listing code to send: get_paths_to_copy with many excludes (as
+produced from .mrunnerignore) and listing of files to archive.
+
+Builds synthetic tree in temporary directory and prints timings; with mrunner
+installed, run e.g.:
+
+    python benchmarks/bench_file_traversal.py --files 200000 --excludes 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from mrunner.utils.utils import get_paths_to_copy, iter_files_to_dump
+
+
+def build_tree(root, num_files, files_per_dir, num_excludes):
+    """Creates num_files empty files in two-level tree of directories under root;
+    returns exclude list: every excluded_dir_*/ and num_excludes single files"""
+    exclude = [".git"]
+    num_dirs = max(1, num_files // files_per_dir)
+    for d in range(num_dirs):
+        # every tenth directory is excluded as whole
+        top = f"excluded_dir_{d}" if d % 10 == 0 else f"dir_{d % 100}"
+        path = os.path.join(root, top, f"sub_{d}")
+        os.makedirs(path)
+        if d % 10 == 0:
+            exclude.append(top)
+        for f in range(files_per_dir):
+            open(os.path.join(path, f"file_{f}.py"), "w").close()
+    # single files are excluded round robin over the other directories
+    kept_dirs = [d for d in range(num_dirs) if d % 10 != 0]
+    for i in range(min(num_excludes, len(kept_dirs) * files_per_dir)):
+        d, f = kept_dirs[i % len(kept_dirs)], i // len(kept_dirs)
+        exclude.append(os.path.join(f"dir_{d % 100}", f"sub_{d}", f"file_{f}.py"))
+    return exclude
+
+
+def timed(label, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"{label}: {time.perf_counter() - start:.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--excludes", type=int, default=5000)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        exclude = timed(
+            f"build tree of {args.files} files",
+            build_tree,
+            root,
+            args.files,
+            args.files_per_dir,
+            args.excludes,
+        )
+        os.chdir(root)
+        try:
+            paths = timed(
+                f"get_paths_to_copy ({len(exclude)} excludes)",
+                get_paths_to_copy,
+                exclude=exclude,
+            )
+            files = timed("iter_files_to_dump", iter_files_to_dump, paths)
+        finally:
+            os.chdir(cwd)
+    print(f"{len(paths)} paths to copy, {len(files)} files to archive")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,15 @@
 # pylint: disable=import-outside-toplevel,missing-function-docstring
 
 
+class SubmissionError(RuntimeError):
+    """Failure after some jobs were submitted; running the sweep again would submit
+    them twice, so it is not retried"""
+
+    def __init__(self, message, job_ids):
+        super(SubmissionError, self).__init__(message)
+        self.job_ids = job_ids
+
+
 def get_backend(backend_type):
     if backend_type == "kubernetes":
         from mrunner.backends.k8s import get_kubernetes_backend
@@ -10,6 +19,10 @@ def get_backend(backend_type):
         from mrunner.backends.slurm import get_slurm_backend
 
         return get_slurm_backend()
+    if backend_type == "local":
+        from mrunner.backends.local import get_local_backend
+
+        return get_local_backend()
 
     raise KeyError(f"No backend type: {backend_type}")
 
@@ -23,5 +36,9 @@ def get_context_cls(backend_type):
         from mrunner.backends.slurm import SlurmContext
 
         return SlurmContext
+    if backend_type == "local":
+        from mrunner.backends.local import LocalContext
+
+        return LocalContext
 
     raise KeyError(f"No backend type: {backend_type}")
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import shutil
+import subprocess
+import time
+from typing import Optional
+
+import attr
+from attrs import define, field
+from path import Path
+
+from mrunner.backends.slurm import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_CONFIGS_DIR_NAME,
+    DEFAULT_LOGS_DIR_NAME,
+    DEFAULT_SCRATCH_DIR,
+)
+from mrunner.experiment import (
+    ContextBase,
+    Experiment,
+    ScratchLayoutMixin,
+    get_num_configs,
+)
+from mrunner.utils.config_pack import CONFIG_PACK_NAME
+from mrunner.utils.utils import (
+    MEM_UNITS,
+    filter_only_attr,
+    get_paths_to_copy,
+    parse_mem,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5  # seconds between checks of running configs
+
+
+@define(kw_only=True)
+class LocalContext(ContextBase):
+    # resources of one config, may be overridden by experiment's resources
+    cpu: Optional[str] = None
+    mem: Optional[str] = None
+    # resources of the machine shared by configs; by default all available
+    max_cpu: Optional[int] = None
+    max_mem: Optional[str] = None
+    pin_cores: bool = True
+    scratch_dir_name: str = DEFAULT_SCRATCH_DIR
+    cache_dir_name: Path = DEFAULT_CACHE_DIR
+    grid_logs_dir_name: str = DEFAULT_LOGS_DIR_NAME
+    grid_configs_dir_name: str = DEFAULT_CONFIGS_DIR_NAME
+    shell: str = "bash"
+
+
+@define
+class _LocalExperiment(ScratchLayoutMixin, LocalContext, Experiment):
+    _experiment_scratch_dir: Path = field(init=False, default=None)
+
+
+def _available_mem():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+@attr.s
+class _LocalTask(object):
+    config_id = attr.ib()
+    cpu = attr.ib()
+    mem = attr.ib()
+    cores = attr.ib(factory=list)
+    process = attr.ib(default=None)
+    log_file = attr.ib(default=None)
+    started = attr.ib(default=None)
+
+
+@attr.s
+class LocalBackend(object):
+    """Runs configs of sweep as processes on local machine, as many at once as cpu
+    and mem budget allows; directories are laid out as on Slurm"""
+
+    def run(self, experiments):
+        experiment = _LocalExperiment(
+            **filter_only_attr(_LocalExperiment, experiments[0])
+        )
+        LOGGER.debug("Configuration: {}".format(experiment))
+
+        for directory in [
+            experiment.experiment_scratch_dir,
+            experiment.grid_logs_dir,
+            experiment.grid_configs_dir,
+        ]:
+            directory.makedirs_p()
+        if experiment.send_code:
+            self.deploy_code(experiment)
+        if experiment.cmd.config_pack:
+            Path(experiment.cmd._experiment_config_path).copy(
+                experiment.grid_configs_dir / CONFIG_PACK_NAME
+            )
+        tasks = []
+        num_configs = get_num_configs(experiments)
+        for config_id in range(num_configs):
+            # lazy grid is single experiment standing for all configs of grid
+            lazy = num_configs != len(experiments)
+            config_experiment = experiments[0 if lazy else config_id]
+            if not experiment.cmd.config_pack:
+                Path(config_experiment["cmd"]._experiment_config_path).copy(
+                    experiment.grid_configs_dir / f"config_{config_id}"
+                )
+            tasks.append(self._create_task(experiment, config_id, config_experiment))
+
+        failed = self.run_tasks(experiment, tasks)
+        if failed:
+            LOGGER.error(
+                "Failed configs: %s; see logs in %s",
+                " ".join(str(task.config_id) for task in failed),
+                experiment.grid_logs_dir,
+            )
+        return (experiment, experiments)
+
+    @staticmethod
+    def deploy_code(experiment):
+        paths_to_dump = get_paths_to_copy(
+            exclude=experiment.exclude, paths_to_copy=experiment.paths_to_copy
+        )
+        for p in paths_to_dump:
+            destination = experiment.experiment_scratch_dir / p.rel_remote_path
+            LOGGER.debug('Copying "%s" to %s', str(p.rel_remote_path), destination)
+            destination.dirname().makedirs_p()
+            if p.local_path.isdir() and not p.local_path.islink():
+                shutil.copytree(p.local_path, destination, symlinks=True)
+            else:
+                shutil.copy2(p.local_path, destination, follow_symlinks=False)
+
+    @staticmethod
+    def _create_task(experiment, config_id, config_experiment):
+        resources = config_experiment.get("resources") or {}
+        unknown = set(resources) - {"cpu", "mem"}
+        if unknown:
+            LOGGER.warning(
+                "Ignoring resources not supported by local backend: %s",
+                ", ".join(sorted(unknown)),
+            )
+        cpu = resources.get("cpu", experiment.cpu)
+        mem = resources.get("mem", experiment.mem)
+        return _LocalTask(
+            config_id=config_id,
+            cpu=int(cpu) if cpu else 1,
+            mem=parse_mem(mem) if mem else 0,
+        )
+
+    def run_tasks(self, experiment, tasks):
+        """Runs tasks, starting each one when enough cpu cores and memory are free;
+        returns list of failed tasks"""
+        free_cores = sorted(os.sched_getaffinity(0))
+        if experiment.max_cpu:
+            free_cores = free_cores[: int(experiment.max_cpu)]
+        free_mem = (
+            parse_mem(experiment.max_mem) if experiment.max_mem else _available_mem()
+        )
+        for task in tasks:
+            if task.cpu > len(free_cores) or task.mem > free_mem:
+                LOGGER.warning(
+                    "Config %d requests more resources than available; limiting it "
+                    "to %d CPU and %d MB",
+                    task.config_id,
+                    len(free_cores),
+                    free_mem // MEM_UNITS["M"],
+                )
+                task.cpu = min(task.cpu, len(free_cores))
+                task.mem = min(task.mem, free_mem)
+
+        pending = list(tasks)
+        running = []
+        failed = []
+        while pending or running:
+            # start every pending task which fits, not only the first one
+            for task in list(pending):
+                if task.cpu <= len(free_cores) and task.mem <= free_mem:
+                    task.cores, free_cores = (
+                        free_cores[: task.cpu],
+                        free_cores[task.cpu :],
+                    )
+                    free_mem -= task.mem
+                    self._start(experiment, task)
+                    pending.remove(task)
+                    running.append(task)
+            time.sleep(POLL_INTERVAL)
+            for task in list(running):
+                returncode = task.process.poll()
+                if returncode is None:
+                    continue
+                task.log_file.close()
+                running.remove(task)
+                free_cores = sorted(free_cores + task.cores)
+                free_mem += task.mem
+                LOGGER.info(
+                    "Config %d finished with code %d in %.1fs",
+                    task.config_id,
+                    returncode,
+                    time.time() - task.started,
+                )
+                if returncode != 0:
+                    failed.append(task)
+        return failed
+
+    @staticmethod
+    def _start(experiment, task):
+        task_dir = Path(f"{experiment.experiment_scratch_dir}_{task.config_id}")
+        # own copy of the code for each config, as on Slurm
+        shutil.copytree(experiment.experiment_scratch_dir, task_dir, symlinks=True)
+        if experiment.cmd.config_pack:
+            (experiment.grid_configs_dir / CONFIG_PACK_NAME).symlink(
+                task_dir / CONFIG_PACK_NAME
+            )
+        else:
+            (experiment.grid_configs_dir / f"config_{task.config_id}").copy(task_dir)
+
+        # env is exported by shell, so values may refer to other variables
+        exports = [f"export {k}={v}" for k, v in experiment.env.items()]
+        script = "\n".join(
+            [f"export MRUNNER_CONFIG_ID={task.config_id}"]
+            + exports
+            + [experiment.cmd.command]
+        )
+        cores = task.cores if experiment.pin_cores else None
+
+        def _pin_cores():
+            if cores:
+                os.sched_setaffinity(0, cores)
+
+        task.log_file = open(
+            experiment.grid_logs_dir / f"local_{task.config_id}.log", "wb"
+        )
+        LOGGER.info(
+            "Starting config %d on cores %s",
+            task.config_id,
+            ",".join(map(str, task.cores)),
+        )
+        task.started = time.time()
+        task.process = subprocess.Popen(
+            [experiment.shell, "-c", script],
+            cwd=task_dir,
+            stdout=task.log_file,
+            stderr=subprocess.STDOUT,
+            preexec_fn=_pin_cores,
+        )
+
+
+_local_backend = None
+
+
+def get_local_backend():
+    global _local_backend
+    if _local_backend is None:
+        _local_backend = LocalBackend()
+    return _local_backend
@@ -1,20 +1,73 @@
 # -*- coding: utf-8 -*-
+import base64
+import gzip
+import hashlib
+import io
+import json
 import logging
-import tarfile
-import tempfile
+import math
+import os
+import sqlite3
+import time
+from typing import Optional
 
 import attr
 from attrs import Factory, define, field
 from fabric import Connection
 from path import Path
-from typing import Optional
 
-from mrunner.experiment import ContextBase, Experiment
-from mrunner.utils.namesgenerator import id_generator
+from mrunner.backends import SubmissionError
+from mrunner.experiment import (
+    ContextBase,
+    Experiment,
+    ScratchLayoutMixin,
+    get_num_configs,
+)
+from mrunner.utils.archive import (
+    AUTO_CODEC,
+    COMPRESSION_MODES,
+    GNU_TAR_NORMALIZE_OPTIONS,
+    add_to_archive,
+    choose_codec,
+    get_codec,
+    get_codec_by_path,
+    open_archive_stream,
+    read_sample,
+)
+from mrunner.utils.cache_gc import (
+    REFS_SUFFIX,
+    delete_cmd,
+    inventory_cmd,
+    parse_inventory,
+    select_evictions,
+)
+from mrunner.utils.git_bundle import (
+    GIT_DIR_NAME,
+    SHIPPED_REFS,
+    create_bundle,
+    diff_working_tree,
+    get_head,
+)
+from mrunner.utils.manifest import SweepManifest
+from mrunner.utils.object_store import (
+    OBJECTS_DIR_NAME,
+    find_missing_cmd,
+    gc_objects_cmd,
+    is_stored,
+    object_name,
+    store_objects_cmd,
+    write_links_archive,
+)
+from mrunner.utils.remote import RemoteBatch, RemoteBatchError, run_with_stdin
 from mrunner.utils.utils import (
     GeneratedTemplateFile,
+    PathToDump,
     filter_only_attr,
+    get_files_manifest,
+    get_manifest_digest,
     get_paths_to_copy,
+    iter_files_to_dump,
+    parse_mem,
     pathify,
 )
 
@@ -24,7 +77,45 @@ DEFAULT_SCRATCH_DIR = "mrunner_scratch"
 DEFAULT_CACHE_DIR = ".cache"
 DEFAULT_LOGS_DIR_NAME = "logs"
 DEFAULT_CONFIGS_DIR_NAME = "configs"
-TMP_CONFIGS_DIR = "___configs___"  # temporary directory name to send configs using the same zip as code, it should be very unique
+# how array tasks get code: own copy of the tree, or links to one read-only tree
+CODE_SHARING_COPY = "copy"
+CODE_SHARING_MODES = [CODE_SHARING_COPY, "symlink", "hardlink"]
+# how array task runs its configs: one after another, or up to ntasks at once
+PACK_MODE_SERIAL = "serial"
+PACK_MODES = [PACK_MODE_SERIAL, "parallel"]
+# task farm workers: MPI ranks of the allocation or local processes
+TASK_FARM_MODES = ["mpi", "local"]
+# resources which may differ between experiments of one sweep; experiments requesting
+# different ones are submitted as separate array jobs
+RESOURCE_KEYS = ["partition", "qos", "time", "ntasks", "nodes", "cpu", "gpu", "mem"]
+# limits of the cluster, unless configured in the context; array jobs are split to
+# fit MaxArraySize and submitted only while user's jobs fit under MaxSubmitJobs
+QUERY_LIMITS_CMD = (
+    "scontrol show config 2> /dev/null"
+    " | awk '/^MaxArraySize/ {print \"max_array_size\", $3}'; "
+    "sacctmgr -n -P show assoc user=$USER format=MaxSubmit 2> /dev/null"
+    " | awk 'NF {print \"max_submit_jobs\", $1; exit}'"
+)
+# pending and running jobs, each array task counted separately
+COUNT_QUEUED_JOBS_CMD = "set -o pipefail; squeue -u $USER -h -r | wc -l"
+# states of array tasks of given jobs, one line per task or range of pending tasks
+SACCT_STATES_CMD = "sacct -n -P -X --format=JobID,State -j "
+THROUGHPUT_PROBE_SIZE = 4 * 1024 * 1024  # bytes sent to measure link throughput
+# delta against previous archive is sent only if it is smaller than that part of code
+DELTA_MAX_RATIO = 0.5
+VENVS_DIR_NAME = ".venvs"
+# short names keep shebangs of scripts in virtualenv under kernel's length limit
+VENV_HASH_LENGTH = 16
+# options of requirements file referring to local paths
+LOCAL_REQUIREMENT_OPTIONS = (
+    "-e",
+    "--editable",
+    "-r",
+    "--requirement",
+    "-c",
+    "--constraint",
+)
+ENV_PACKS_DIR_NAME = ".env_packs"
 
 
 @define(kw_only=True)
@@ -55,75 +146,285 @@ class SlurmContext(ContextBase):
     grid_logs_dir_name: str = DEFAULT_LOGS_DIR_NAME
     grid_configs_dir_name: str = DEFAULT_CONFIGS_DIR_NAME
     shebang: str = "#!/usr/bin/env bash"
+    compression: str = field(
+        default="gzip", validator=attr.validators.in_(COMPRESSION_MODES)
+    )
+    compression_level: Optional[int] = None
+    code_sharing: str = field(
+        default=CODE_SHARING_COPY, validator=attr.validators.in_(CODE_SHARING_MODES)
+    )
+    node_local_dir: Optional[str] = None
+    # pack activated venv or conda env once and unpack it to node_local_dir (or /tmp),
+    # shared by tasks on the node, so imports do not hit shared filesystem
+    stage_env: bool = False
+    configs_per_task: Optional[int] = None
+    config_time: Optional[str] = None
+    pack_mode: str = field(
+        default=PACK_MODE_SERIAL, validator=attr.validators.in_(PACK_MODES)
+    )
+    task_farm: Optional[str] = field(
+        default=None,
+        validator=attr.validators.optional(attr.validators.in_(TASK_FARM_MODES)),
+    )
+    max_array_size: Optional[int] = None
+    max_submit_jobs: Optional[int] = None
+    max_concurrent: Optional[int] = None
+    submit_poll_interval: int = 60
+    # send only files changed since the newest code archive of the project in cache
+    delta_upload: bool = True
+    # keep code files in content-addressed store and deploy them as hard links
+    code_store: bool = False
+    # ship commits missing in project's git mirror on the cluster and uncommitted diff
+    git_bundle: bool = False
+    # budget of scratch_dir (e.g. "500G", inodes), kept by evicting least recently
+    # used sweep directories and cached archives, by `mrunner gc` or after submit
+    gc_max_bytes: Optional[str] = None
+    gc_max_inodes: Optional[int] = None
+    gc_after_submit: bool = False
 
 
 @define
-class _SlurmExperiment(SlurmContext, Experiment):
+class _SlurmExperiment(ScratchLayoutMixin, SlurmContext, Experiment):
     _experiment_scratch_dir: Path = field(init=False, default=None)
 
     @property
-    def scratch_dir(self):
-        return Path(self.storage_dir) / pathify(self.scratch_dir_name)
+    def objects_dir(self):
+        return self.scratch_dir / OBJECTS_DIR_NAME
 
     @property
-    def cache_dir(self):
-        return self.scratch_dir / pathify(self.cache_dir_name)
+    def venvs_dir(self):
+        return self.scratch_dir / VENVS_DIR_NAME
 
     @property
-    def project_scratch_dir(self):
-        return self.scratch_dir / pathify(self.project.split("/")[-1])
+    def env_packs_dir(self):
+        return self.scratch_dir / ENV_PACKS_DIR_NAME
 
     @property
-    def grid_scratch_dir(self):
-        return self.project_scratch_dir / pathify(self.unique_name)
+    def git_mirror_dir(self):
+        return self.scratch_dir / GIT_DIR_NAME / f"{self.project_scratch_dir.name}.git"
 
     @property
-    def experiment_scratch_dir(self):
-        if self._experiment_scratch_dir is None:
-            # TODO(pj): Change id_generator to hyper-params shorthand
-            self._experiment_scratch_dir = self.grid_scratch_dir / pathify(
-                self.name + "_" + id_generator(4)
-            )
-        return self._experiment_scratch_dir
+    def archive_level(self):
+        """Compression level of archives; levels differ between codecs, so in auto
+        mode each codec uses its default"""
+        if self.compression == AUTO_CODEC:
+            return None
+        return self.compression_level
 
     @property
-    def grid_logs_dir(self):
-        return self.grid_scratch_dir / self.grid_logs_dir_name
+    def pack_size(self):
+        """Number of configs run by one array task; given directly or derived from
+        time and expected time of one config"""
+        if self.configs_per_task:
+            return int(self.configs_per_task)
+        if self.config_time:
+            config_seconds = parse_slurm_time(self.config_time)
+            if config_seconds <= 0:
+                raise ValueError(
+                    f"config_time must be positive, got {self.config_time!r}"
+                )
+            per_slot = parse_slurm_time(self.time) // config_seconds
+            slots = int(self.ntasks) if self.pack_mode != PACK_MODE_SERIAL else 1
+            return max(1, per_slot * slots)
+        return 1
+
+    def array_size(self, num_configs):
+        if self.task_farm:
+            # task farm runs all configs within one allocation
+            return 1
+        return math.ceil(num_configs / self.pack_size)
+
+    def array_task(self, config_index):
+        """Index of array task running config_index-th config of the script"""
+        return 0 if self.task_farm else config_index // self.pack_size
+
+
+def parse_slurm_time(time):
+    """Converts Slurm time limit ("minutes", "minutes:seconds", "hours:minutes:seconds",
+    "days-hours", "days-hours:minutes" or "days-hours:minutes:seconds") into seconds"""
+    days, _, rest = str(time).rpartition("-")
+    parts = [int(p) for p in rest.split(":")]
+    if days:
+        # after days, fields are hours[:minutes[:seconds]]
+        parts += [0] * (3 - len(parts))
+        hours, minutes, seconds = parts
+    elif len(parts) == 3:
+        hours, minutes, seconds = parts
+    else:
+        hours = 0
+        minutes, seconds = (parts + [0])[:2]
+    return ((int(days or 0) * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def local_requirements(requirements):
+    """Lines of requirements file installed from local paths (editable, relative or
+    file: ones, and included requirement files), which are not covered by hash of the
+    file"""
+    local = []
+    for line in requirements.splitlines():
+        line = line.split(" #")[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        if (
+            line.split()[0] in LOCAL_REQUIREMENT_OPTIONS
+            or line.startswith(LOCAL_REQUIREMENT_OPTIONS)
+            or line.startswith((".", "/", "~"))
+            or "file:" in line
+        ):
+            local.append(line)
+    return local
+
+
+def get_resources(experiment):
+    """Slurm resources requested by experiment: those of the context, overridden by
+    experiment's `resources`"""
+    overrides = experiment.get("resources") or {}
+    unknown = set(overrides) - set(RESOURCE_KEYS)
+    if unknown:
+        raise ValueError(
+            f"Unsupported Slurm resources: {', '.join(sorted(unknown))}; "
+            f"choose from: {', '.join(RESOURCE_KEYS)}"
+        )
+    return {key: overrides.get(key, experiment.get(key)) for key in RESOURCE_KEYS}
 
-    @property
-    def grid_configs_dir(self):
-        return self.grid_scratch_dir / self.grid_configs_dir_name
+
+def group_by_resources(experiments):
+    """Groups experiments requesting the same resources; returns list of
+    (resources, indices of configs) in order of first occurrence. All configs of
+    lazy grid experiment request the same resources."""
+    num_configs = get_num_configs(experiments)
+    if num_configs != len(experiments):
+        return [(get_resources(experiments[0]), range(num_configs))]
+    groups = {}
+    for idx, experiment in enumerate(experiments):
+        resources = get_resources(experiment)
+        key = tuple((k, str(v)) for k, v in resources.items())
+        groups.setdefault(key, (resources, []))[1].append(idx)
+    return list(groups.values())
+
+
+def split_array(array_size, max_size=None):
+    """Splits array of array_size tasks into (offset, size) chunks of at most
+    max_size tasks"""
+    max_size = max_size or array_size
+    return [
+        (offset, min(max_size, array_size - offset))
+        for offset in range(0, array_size, max_size)
+    ]
+
+
+def parse_sacct_states(output):
+    """Parses output of SACCT_STATES_CMD into {(job_id, task_id): state}"""
+    states = {}
+    for line in output.splitlines():
+        job, _, state = line.strip().partition("|")
+        if not state:
+            continue
+        # e.g. "CANCELLED by 1000"
+        state = state.split()[0]
+        job_id, _, tasks = job.partition("_")
+        # pending tasks are reported as ranges, e.g. 123_[4-9,12%2]
+        for part in tasks.strip("[]").split("%")[0].split(",") if tasks else ["0"]:
+            first, _, last = part.partition("-")
+            for task_id in range(int(first), int(last or first) + 1):
+                states[(job_id, task_id)] = state
+    return states
+
+
+def parse_cluster_limits(output):
+    """Parses output of QUERY_LIMITS_CMD; missing or unlimited limits are skipped"""
+    limits = {}
+    for line in output.splitlines():
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            limits[key] = int(value)
+    return limits
+
+
+@attr.s
+class _ArrayChunk(object):
+    name = attr.ib()
+    command = attr.ib()
+    size = attr.ib()
+    tasks = attr.ib(factory=list)
+    job_id = attr.ib(default=None)
+    submitted = attr.ib(default=False)
 
 
 class ExperimentScript(GeneratedTemplateFile):
     DEFAULT_SLURM_EXPERIMENT_SCRIPT_TEMPLATE = "slurm_experiment.sh.jinja2"
 
-    def __init__(self, experiment: _SlurmExperiment):
+    def __init__(
+        self,
+        experiment: _SlurmExperiment,
+        num_configs,
+        code_archive=None,
+        config_ids=None,
+        name_suffix="",
+        venv_dir=None,
+    ):
+        """config_ids maps consecutive indices of configs run by the script to ids of
+        config files; by default they are the same. venv_dir is virtualenv shared by
+        sweeps, built by the first task needing it"""
+        self.experiment = experiment
+        self.name_suffix = name_suffix
+        script_path = experiment.project_scratch_dir / self.script_name
         super(ExperimentScript, self).__init__(
             template_filename=self.DEFAULT_SLURM_EXPERIMENT_SCRIPT_TEMPLATE,
             experiment=experiment,
+            code_archive=code_archive,
+            venv_dir=venv_dir,
+            num_configs=num_configs,
+            config_ids=config_ids,
+            configs_per_task=experiment.pack_size,
+            script_path=script_path,
+            refs_path=script_path + REFS_SUFFIX,
         )
-        self.experiment = experiment
         self.path.chmod("a+x")
 
     @property
     def script_name(self):
         e = self.experiment
-        return "{}.sh".format(e.experiment_scratch_dir.relpath(e.project_scratch_dir))
+        return "{}{}.sh".format(
+            e.experiment_scratch_dir.relpath(e.project_scratch_dir), self.name_suffix
+        )
 
 
 class SlurmWrappersCmd(object):
-    def __init__(self, experiment, script_path, array_size, cmd_type):
+    def __init__(
+        self,
+        experiment,
+        script_path,
+        array_size,
+        cmd_type,
+        log_name=None,
+        array_offset=0,
+    ):
+        if experiment.task_farm == "mpi" and int(experiment.ntasks or 1) < 2:
+            raise ValueError(
+                "task_farm: mpi needs ntasks of at least 2, as rank 0 only hands out "
+                "configs"
+            )
         self._experiment = experiment
         self._script_path = script_path
         self.array_str = rf"0-{array_size - 1}"
+        if experiment.max_concurrent:
+            self.array_str += f"%{experiment.max_concurrent}"
+        # array indices start from 0 in every chunk of split array
+        self.export = (
+            f"ALL,MRUNNER_ARRAY_OFFSET={array_offset}" if array_offset else None
+        )
         self._cmd = cmd_type
+        self._log_name = log_name or "slurm_%a.log"
 
     @property
     def command(self):
         # see: https://slurm.schedmd.com/srun.html
         # see: https://slurm.schedmd.com/sbatch.html
         cmd_items = [self._cmd]
+        if self._cmd == "sbatch":
+            # only job id is printed, so it can be recorded in manifest
+            cmd_items.append("--parsable")
 
         def _extend_cmd_items(cmd_items, option, data_key, default=None):
             value = self._getattr(data_key)
@@ -133,7 +434,7 @@ class SlurmWrappersCmd(object):
                 cmd_items += [option, default]
 
         default_log_path = (
-            self._experiment.grid_logs_dir / "slurm_%a.log"
+            self._experiment.grid_logs_dir / self._log_name
             if self._cmd == "sbatch"
             else None
         )
@@ -147,6 +448,7 @@ class SlurmWrappersCmd(object):
         _extend_cmd_items(cmd_items, "--nodelist", "nodelist")
         _extend_cmd_items(cmd_items, "--exclude", "exclude_nodes")
         _extend_cmd_items(cmd_items, "--array", "array_str")
+        _extend_cmd_items(cmd_items, "--export", "export")
 
         cmd_items += self._resources_items()
         cmd_items += [self._script_path]
@@ -159,6 +461,12 @@ class SlurmWrappersCmd(object):
     def _resources_items(self):
         """mapping from mrunner notation into slurm"""
         cmd_items = []
+        # tasks (configs run in parallel, workers of task farm) get CPUs of their own,
+        # also when cpu is not given
+        ntasks = int(self._getattr("ntasks") or 1)
+        if ntasks > 1 or self._getattr("task_farm"):
+            cmd_items += ["-n", str(ntasks)]
+            LOGGER.debug("Running %d tasks", ntasks)
         # mrunner_resources = self._getattr('resources')
         # TODO(pm): Refactor me please
         mrunner_resources = {}
@@ -170,10 +478,6 @@ class SlurmWrappersCmd(object):
                 ntasks = int(self._getattr("ntasks") or 1)
                 cores_per_task = int(int(resource_qty) / ntasks)
                 cmd_items += ["-c", str(cores_per_task)]
-
-                if ntasks > 1:
-                    cmd_items += ["-n", str(ntasks)]
-                    LOGGER.debug("Running %d tasks", ntasks)
                 total_cpus = cores_per_task * ntasks
                 if total_cpus != int(resource_qty):
                     LOGGER.warning(
@@ -204,13 +508,162 @@ class SlurmWrappersCmd(object):
 class SlurmBackend(object):
     initialized = attr.ib(default=False, init=False)
     conn_cache = {}
+    throughput_cache = {}
+    limits_cache = {}
 
     def run(self, experiments):
-        experiment = experiments[
-            0
-        ]  # Assume that all experiments share deployment config. This should be reflected in all code.
+        # experiments share deployment config (code, environment) with the first one;
+        # those requesting different resources are submitted as separate array jobs
+        groups = group_by_resources(experiments)
+        if len(groups) > 1:
+            LOGGER.info(
+                "Experiments request %d different sets of resources; "
+                "submitting %d array jobs",
+                len(groups),
+                len(groups),
+            )
+        experiment = experiments[0]
+        self._connect(experiment["slurm_url"])
+
+        # create Slurm experiment
+        experiment = self._create_experiment(experiment, groups[0][0])
+
+        LOGGER.debug("Configuration: {}".format(experiment))
+
+        # remote steps are batched to save SSH round-trips: the first batch prepares
+        # directories and looks up cached code, the second deploys and submits
+        prepare = RemoteBatch()
+        self.ensure_directories(experiment, prepare)
+        code = self.find_cached_code(experiment, prepare)
+        self.query_limits(experiment, prepare)
+        prepare_results = prepare.run(self.connection)
+        self.resolve_code_archive(experiment, code, prepare_results)
+        max_array_size, max_submit_jobs = self.resolve_limits(
+            experiment, prepare_results
+        )
+
+        submit = RemoteBatch()
+        self.deploy_configs(experiment, submit)
+        venv_dir = self.shared_venv_dir(experiment)
+        if experiment.stage_env and not (experiment.venv or experiment.conda):
+            LOGGER.warning("stage_env is set, but there is no venv or conda to stage")
+        chunks = []
+        for group_idx, (resources, config_ids) in enumerate(groups):
+            if group_idx == 0:
+                group_experiment = experiment
+            else:
+                group_experiment = self._create_experiment(
+                    experiments[config_ids[0]], resources
+                )
+                # all groups run the same deployed code
+                group_experiment._experiment_scratch_dir = (
+                    experiment.experiment_scratch_dir
+                )
+            suffix = f"_{group_idx}" if len(groups) > 1 else ""
+
+            # create experiment script
+            script = ExperimentScript(
+                group_experiment,
+                num_configs=len(config_ids),
+                # code deployed from store or git mirror is not archived
+                code_archive=code if code is not None and code.remote_path else None,
+                config_ids=config_ids if len(groups) > 1 else None,
+                name_suffix=suffix,
+                venv_dir=venv_dir,
+            )
+            remote_script_path = experiment.project_scratch_dir / script.script_name
+            self.send_script(script, remote_script_path, submit, "send_script" + suffix)
+
+            array_chunks = split_array(
+                group_experiment.array_size(len(config_ids)),
+                min(filter(None, [max_array_size, max_submit_jobs]), default=None),
+            )
+            for chunk_idx, (offset, size) in enumerate(array_chunks):
+                chunk_suffix = suffix + (
+                    f"_{chunk_idx}" if len(array_chunks) > 1 else ""
+                )
+                cmd = SlurmWrappersCmd(
+                    experiment=group_experiment,
+                    script_path=remote_script_path,
+                    array_size=size,
+                    cmd_type=group_experiment.cmd_type,
+                    log_name=f"slurm{chunk_suffix}_%a.log",
+                    array_offset=offset,
+                )
+                log_path = (
+                    None
+                    if group_experiment.log_output_path
+                    else group_experiment.grid_logs_dir
+                    / f"slurm{chunk_suffix}_{{}}.log"
+                )
+                tasks = self._chunk_tasks(
+                    experiment, group_experiment, experiments, config_ids, offset, size
+                )
+                for task in tasks:
+                    task["log_path"] = (
+                        log_path.format(
+                            "%a" if task["task_id"] is None else task["task_id"]
+                        )
+                        if log_path
+                        else None
+                    )
+                chunks.append(
+                    _ArrayChunk("submit" + chunk_suffix, cmd.command, size, tasks)
+                )
+
+        # chunks which do not fit under the submit limit wait in submission queue
+        fitting = len(chunks)
+        if max_submit_jobs:
+            free = max_submit_jobs - self._queued_jobs(
+                prepare_results["count_queued_jobs"]
+            )
+            fitting = 0
+            for chunk in chunks:
+                if chunk.size > free:
+                    break
+                free -= chunk.size
+                fitting += 1
+        chunks, pending = chunks[:fitting], chunks[fitting:]
+
+        # code upload streams the rest of input, so it follows steps sending files
+        self.deploy_code(experiment, submit, code)
+        for chunk in chunks:
+            submit.add(chunk.name, chunk.command, echo=True)
+        try:
+            results = submit.run(self.connection)
+        except RemoteBatchError as e:
+            for chunk in chunks:
+                result = e.results[chunk.name]
+                if result.ok:
+                    chunk.submitted = True
+                    chunk.job_id = self._parse_job_id(experiment, result.stdout)
+            if not any(e.results[chunk.name].started for chunk in chunks):
+                raise
+            self._abort_submission(experiment, chunks + pending, e)
+        for chunk in chunks:
+            chunk.submitted = True
+            chunk.job_id = self._parse_job_id(experiment, results[chunk.name].stdout)
+        self.record_sweep(experiment, chunks + pending)
+        if pending:
+            try:
+                self.drain_submission_queue(
+                    experiment,
+                    pending,
+                    max_submit_jobs,
+                    experiment.submit_poll_interval,
+                )
+            except Exception as e:
+                self._abort_submission(experiment, chunks + pending, e)
+            self.record_sweep(experiment, chunks + pending)
+        if experiment.gc_after_submit:
+            try:
+                self.collect_garbage(experiments[0], keep=[experiment.grid_scratch_dir])
+            except Exception as e:
+                LOGGER.warning("Garbage collection failed: %s", e)
+        return (experiment, experiments)
+
+    def _connect(self, slurm_url):
         # configure fabric
-        slurm_url = experiment["slurm_url"]
         if slurm_url in self.conn_cache:
             self.connection = self.conn_cache[slurm_url]
             LOGGER.debug("REUSING cached connection")
@@ -219,99 +672,676 @@ class SlurmBackend(object):
             self.connection = Connection(slurm_url)
             self.conn_cache[slurm_url] = self.connection
 
-        # create Slurm experiment
-        experiment = _SlurmExperiment(
-            **filter_only_attr(_SlurmExperiment, experiment),
-        )
+    @staticmethod
+    def _chunk_tasks(
+        experiment, group_experiment, experiments, config_ids, offset, size
+    ):
+        """Manifest entries of configs run by array chunk of size tasks from offset;
+        configs of lazy grid are not enumerated, one entry (without task id) stands
+        for all configs of the chunk"""
+        if get_num_configs(experiments) != len(experiments):
+            if group_experiment.task_farm:
+                first, last = 0, len(config_ids) - 1
+            else:
+                first = offset * group_experiment.pack_size
+                last = min(
+                    len(config_ids), (offset + size) * group_experiment.pack_size
+                )
+                last -= 1
+            return [
+                dict(
+                    config_id=first,
+                    task_id=None,
+                    parameters={"configs": [first, last]},
+                    task_dir=f"{experiment.experiment_scratch_dir}_{{{first}..{last}}}",
+                )
+            ]
+        tasks = []
+        for config_index, config_id in enumerate(config_ids):
+            task_id = group_experiment.array_task(config_index) - offset
+            if 0 <= task_id < size:
+                tasks.append(
+                    dict(
+                        config_id=config_id,
+                        task_id=task_id,
+                        parameters=experiments[config_id].get("parameters"),
+                        task_dir=f"{experiment.experiment_scratch_dir}_{config_id}",
+                    )
+                )
+        return tasks
 
-        # create experiment script
-        script = ExperimentScript(experiment)
-        remote_script_path = experiment.project_scratch_dir / script.script_name
-        archive_remote_path = experiment.cache_dir / experiment.unique_name
+    def _abort_submission(self, experiment, chunks, error):
+        """Records jobs submitted so far and raises SubmissionError, as submitting
+        the sweep again would run their configs twice"""
+        self.record_sweep(experiment, chunks)
+        submitted = [chunk for chunk in chunks if chunk.submitted]
+        job_ids = [chunk.job_id for chunk in submitted if chunk.job_id]
+        raise SubmissionError(
+            f"Submission of sweep {experiment.unique_name} failed after "
+            f"{len(submitted)} of {len(chunks)} array jobs were submitted "
+            f"(job ids: {', '.join(job_ids) or 'none'}); not submitted: "
+            f"{', '.join(chunk.name for chunk in chunks if not chunk.submitted)}. "
+            f"Check the queue before submitting the rest: {error}",
+            job_ids,
+        ) from error
 
-        LOGGER.debug("Configuration: {}".format(experiment))
+    @staticmethod
+    def _parse_job_id(experiment, output):
+        if experiment.cmd_type != "sbatch" or not output.strip():
+            return None
+        # --parsable prints "job_id" or "job_id;cluster"
+        return output.strip().splitlines()[-1].split(";")[0]
 
-        self.ensure_directories(experiment)
-        self.cache_code(experiment, archive_remote_path)
-        self.deploy_code(experiment, archive_remote_path)
-        self.send_script(script, remote_script_path)
+    def record_sweep(self, experiment, chunks):
+        """Records job ids, parameters and paths of configs in the sweep manifest,
+        for `mrunner status`"""
+        if experiment.cmd_type != "sbatch":
+            return
+        tasks = [
+            dict(task, job_id=chunk.job_id) for chunk in chunks for task in chunk.tasks
+        ]
+        try:
+            manifest = SweepManifest()
+            manifest.record_sweep(
+                unique_name=experiment.unique_name,
+                project=experiment.project,
+                name=experiment.name,
+                cluster=experiment.slurm_url,
+                grid_dir=experiment.grid_scratch_dir,
+                tasks=tasks,
+            )
+            manifest.close()
+        except sqlite3.Error as e:
+            LOGGER.warning("Could not record sweep in manifest: %s", e)
 
-        cmd = SlurmWrappersCmd(
-            experiment=experiment,
-            script_path=remote_script_path,
-            array_size=len(experiments),
-            cmd_type=experiment.cmd_type,
+    def collect_garbage(self, context, keep=(), max_bytes=None, max_inodes=None):
+        """Evicts least recently used sweep directories, cached code archives, shared
+        virtualenvs and packed environments not used by queued jobs, until
+        scratch_dir fits in budget (by default from context), and removes objects of
+        code store no deployment links to; returns (evicted entries, number of
+        removed objects)"""
+        self._connect(context["slurm_url"])
+        scratch_dir = Path(context["storage_dir"]) / pathify(
+            context.get("scratch_dir_name") or DEFAULT_SCRATCH_DIR
         )
-        self._fabric_run(cmd.command, warn=False)
-        return (experiment, experiments)
+        max_bytes = max_bytes or context.get("gc_max_bytes")
+        max_inodes = max_inodes or context.get("gc_max_inodes")
+
+        evicted = []
+        if max_bytes or max_inodes:
+            # one command lists usage of all entries and paths used by queued jobs
+            result = self._fabric_run(
+                inventory_cmd(
+                    scratch_dir,
+                    [
+                        context.get("cache_dir_name") or DEFAULT_CACHE_DIR,
+                        VENVS_DIR_NAME,
+                        ENV_PACKS_DIR_NAME,
+                    ],
+                    [OBJECTS_DIR_NAME, GIT_DIR_NAME],
+                ),
+                warn=True,
+                hide=True,
+            )
+            if result.failed:
+                raise RuntimeError(
+                    "Garbage collection aborted, could not list usage of scratch "
+                    f"directory or queued jobs: {result.stderr.strip()}"
+                )
+            entries, fixed, referenced = parse_inventory(result.stdout, scratch_dir)
+            evicted = select_evictions(
+                entries,
+                fixed,
+                referenced + [str(path) for path in keep],
+                max_bytes=parse_mem(max_bytes) if max_bytes else None,
+                max_inodes=int(max_inodes) if max_inodes else None,
+            )
+
+        batch = RemoteBatch()
+        if evicted:
+            LOGGER.info(
+                "Evicting %d entries (%d bytes, %d inodes)",
+                len(evicted),
+                sum(entry.bytes for entry in evicted),
+                sum(entry.inodes for entry in evicted),
+            )
+            batch.add_with_input(
+                "remove_evicted",
+                delete_cmd(scratch_dir),
+                "\0".join(path for entry in evicted for path in entry.paths).encode(
+                    "utf-8"
+                ),
+            )
+        # deployments are removed first, as they hold links to objects
+        batch.add("gc_objects", gc_objects_cmd(scratch_dir / OBJECTS_DIR_NAME))
+        results = batch.run(self.connection)
+        return evicted, int(results["gc_objects"].stdout.strip() or 0)
+
+    def query_states(self, slurm_url, job_ids):
+        """Returns {(job_id, task_id): state} of array tasks of job_ids, queried with
+        single sacct call"""
+        self._connect(slurm_url)
+        result = self._fabric_run(
+            SACCT_STATES_CMD + ",".join(sorted(job_ids)), hide=True
+        )
+        return parse_sacct_states(result.stdout)
 
-    def ensure_directories(self, experiment):
-        self._ensure_dir(experiment.experiment_scratch_dir)
-        self._ensure_dir(experiment.grid_logs_dir)
+    @staticmethod
+    def _create_experiment(experiment, resources):
+        params = dict(experiment)
+        params.update({k: v for k, v in resources.items() if v is not None})
+        return _SlurmExperiment(**filter_only_attr(_SlurmExperiment, params))
+
+    def ensure_directories(self, experiment, batch):
+        directories = [experiment.experiment_scratch_dir, experiment.grid_logs_dir]
         if not self.initialized:
-            self._ensure_dir(experiment.cache_dir)
+            directories.append(experiment.cache_dir)
             self.initialized = True
+        batch.add("ensure_directories", "mkdir -p " + " ".join(directories))
+
+    def query_limits(self, experiment, batch):
+        """Adds lookup of cluster limits (unless cached) and of number of user's
+        queued jobs (if it may be needed) to batch"""
+        known = self.limits_cache.get(experiment.slurm_url)
+        if known is None:
+            batch.add("query_limits", QUERY_LIMITS_CMD, warn=True)
+        if experiment.max_submit_jobs or known is None or known.get("max_submit_jobs"):
+            batch.add("count_queued_jobs", COUNT_QUEUED_JOBS_CMD, warn=True)
+
+    def resolve_limits(self, experiment, batch_results):
+        """Returns (max_array_size, max_submit_jobs); configured limits take
+        precedence over those of the cluster"""
+        if experiment.slurm_url not in self.limits_cache:
+            result = batch_results["query_limits"]
+            self.limits_cache[experiment.slurm_url] = (
+                parse_cluster_limits(result.stdout) if result.ok else {}
+            )
+            LOGGER.debug("Cluster limits: %s", self.limits_cache[experiment.slurm_url])
+        limits = self.limits_cache[experiment.slurm_url]
+        return (
+            experiment.max_array_size or limits.get("max_array_size"),
+            experiment.max_submit_jobs or limits.get("max_submit_jobs"),
+        )
+
+    @staticmethod
+    def _queued_jobs(result):
+        if not result.ok:
+            # assuming empty queue could submit past the limit
+            raise RuntimeError(f"Could not count queued jobs: {result.stdout}")
+        return int(result.stdout.strip() or 0)
+
+    def drain_submission_queue(
+        self, experiment, chunks, max_submit_jobs, poll_interval
+    ):
+        """Submits chunks of array jobs as jobs queued earlier finish, keeping the
+        number of user's jobs under max_submit_jobs"""
+        chunks = list(chunks)
+        while chunks:
+            result = self._fabric_run(COUNT_QUEUED_JOBS_CMD, warn=True, hide=True)
+            if result.ok:
+                free = max_submit_jobs - int(result.stdout.strip())
+            else:
+                LOGGER.warning("Could not count queued jobs: %s", result.stderr)
+                free = 0
+            while chunks and chunks[0].size <= free:
+                chunk = chunks.pop(0)
+                chunk.job_id = self._parse_job_id(
+                    experiment, self._fabric_run(chunk.command).stdout
+                )
+                chunk.submitted = True
+                free -= chunk.size
+            if chunks:
+                LOGGER.info(
+                    "%d array jobs wait for queue to drain (%d free slots); "
+                    "next check in %ds",
+                    len(chunks),
+                    free,
+                    poll_interval,
+                )
+                time.sleep(poll_interval)
+
+    @staticmethod
+    def shared_venv_dir(experiment):
+        """Directory of virtualenv set up from requirements_file, shared by sweeps with
+        the same requirements and modules; None, if tasks set up venv themselves"""
+        if not (experiment.venv and experiment.requirements_file):
+            return None
+        try:
+            requirements = (Path(experiment.cwd) / experiment.requirements_file).bytes()
+        except OSError as e:
+            LOGGER.warning(
+                "Could not read requirements, each task installs them: %s", e
+            )
+            return None
+        local = local_requirements(requirements.decode("utf-8", errors="replace"))
+        if local:
+            # they would be installed from (or linked to) directory of one task
+            LOGGER.warning(
+                "Requirements refer to local paths, each task installs them: %s",
+                ", ".join(local),
+            )
+            return None
+        # modules may provide python
+        digest = hashlib.sha256(requirements)
+        digest.update("\n".join(experiment.modules_to_load).encode("utf-8"))
+        return experiment.venvs_dir / digest.hexdigest()[:VENV_HASH_LENGTH]
 
-    def cache_code(self, experiment, archive_remote_path):
+    def find_cached_code(self, experiment, batch):
+        """Adds lookup of cached code archive to batch; archive is keyed by content, so
+        unchanged code is reused between sweeps. With delta_upload, the newest archive
+        of the project and its manifest are looked up as well."""
         if not experiment.send_code:
+            return None
+
+        paths_to_dump = get_paths_to_copy(
+            exclude=experiment.exclude, paths_to_copy=experiment.paths_to_copy
+        )
+        if experiment.git_bundle:
+            code = self._find_mirror_commits(experiment, batch, paths_to_dump)
+            if code is not None:
+                return code
+
+        manifest = get_files_manifest(paths_to_dump)
+        if experiment.code_store:
+            code = _CodeArchive(
+                paths_to_dump=paths_to_dump, remote_base=None, manifest=manifest
+            )
+            object_names = {
+                object_name(entry) for _, _, entry in manifest if is_stored(entry)
+            }
+            batch.add_with_input(
+                "find_missing_objects",
+                find_missing_cmd(experiment.objects_dir),
+                "".join(f"{name}\n" for name in sorted(object_names)).encode(),
+            )
+            return code
+
+        code = _CodeArchive(
+            paths_to_dump=paths_to_dump,
+            remote_base=experiment.cache_dir
+            / "{}-{}".format(
+                experiment.project_scratch_dir.name, get_manifest_digest(manifest)
+            ),
+            manifest=manifest,
+        )
+        batch.add(
+            "find_cached_code", f"ls -1 {code.remote_base}.tar* 2> /dev/null", warn=True
+        )
+        if experiment.delta_upload:
+            # manifests are stored only next to complete archives
+            pattern = experiment.cache_dir / "{}-{}.manifest".format(
+                experiment.project_scratch_dir.name, "?" * 64
+            )
+            batch.add(
+                "find_base_code",
+                f"m=$(ls -1t {pattern} 2> /dev/null | head -n 1) && "
+                "a=$(ls -1 ${m%.manifest}.tar* | grep -v '[.]part$' | head -n 1) && "
+                '[ -n "$a" ] && echo $a && gzip -c $m | base64 -w 0',
+                warn=True,
+            )
+        return code
+
+    @staticmethod
+    def _find_mirror_commits(experiment, batch, paths_to_dump):
+        if experiment.paths_to_copy:
+            LOGGER.warning("paths_to_copy are not in git repository; sending archive")
+            return None
+        head = get_head()
+        if head is None:
+            LOGGER.warning("Code is not in git repository; sending archive")
+            return None
+        batch.add(
+            "find_mirror_commits",
+            f"git -C {experiment.git_mirror_dir} for-each-ref "
+            f"--format='%(objectname)' {SHIPPED_REFS} 2> /dev/null",
+            warn=True,
+        )
+        return _CodeArchive(
+            paths_to_dump=paths_to_dump, remote_base=None, git_head=head
+        )
+
+    def resolve_code_archive(self, experiment, code, results):
+        """Sets path and codec of code archive: cached one if found by
+        find_cached_code, otherwise the one to be uploaded, as a delta against the
+        newest archive of the project if it pays off. With code_store, sets objects
+        missing in store instead."""
+        if code is None:
             return
-        if self._file_exists(archive_remote_path):
+        if code.git_head:
+            result = results["find_mirror_commits"]
+            code.git_bundle = create_bundle(
+                code.git_head, result.stdout.split() if result.ok else []
+            )
+            code.git_diff = diff_working_tree(
+                code.git_head, self._excluded_paths(experiment)
+            )
+            LOGGER.info(
+                "Sending git bundle of %d bytes and diff of %d bytes",
+                len(code.git_bundle or b""),
+                len(code.git_diff),
+            )
+            return
+        if experiment.code_store:
+            self._resolve_missing_objects(experiment, code, results)
             return
 
-        paths_to_copy = (
-            experiment.paths_to_copy if experiment.paths_to_copy is not None else []
-        )
-        paths_to_copy.append(
-            rf"{experiment.cmd._experiment_config_path.dirname()}:{TMP_CONFIGS_DIR}"
+        lookup_result = results["find_cached_code"]
+        base_result = results.get("find_base_code")
+        cached_archives = [
+            path
+            for path in (lookup_result.stdout.split() if lookup_result.ok else [])
+            if not path.endswith(".part")
+        ]
+        if cached_archives:
+            code.cached = True
+            code.remote_path = Path(cached_archives[0])
+            code.codec = get_codec_by_path(code.remote_path)
+            LOGGER.info("Reusing cached code archive %s", code.remote_path)
+            return
+
+        code.codec = self._choose_codec(experiment, code.paths_to_dump)
+        code.remote_path = Path(f"{code.remote_base}{code.codec.suffix}")
+        if base_result is not None and base_result.ok:
+            self._resolve_delta(code, *base_result.stdout.split()[:2])
+
+    def _resolve_missing_objects(self, experiment, code, results):
+        missing = set(results["find_missing_objects"].stdout.split())
+        code.missing_objects = {}
+        for local_path, _, entry in code.manifest:
+            if is_stored(entry) and object_name(entry) in missing:
+                code.missing_objects.setdefault(object_name(entry), local_path)
+        LOGGER.info(
+            "%d of %d files are missing in code store",
+            len(code.missing_objects),
+            len(code.manifest),
         )
-        paths_to_dump = get_paths_to_copy(
-            exclude=experiment.exclude, paths_to_copy=paths_to_copy
+        if code.missing_objects:
+            code.codec = self._choose_codec(experiment, code.paths_to_dump)
+
+    @staticmethod
+    def _resolve_delta(code, base_path, base_manifest):
+        base_manifest = json.loads(gzip.decompress(base64.b64decode(base_manifest)))
+        changed = [
+            (local_path, arcname)
+            for local_path, arcname, entry in code.manifest
+            if base_manifest.get(arcname) != entry
+        ]
+        sizes = {
+            local_path: os.lstat(local_path).st_size
+            for local_path, _, _ in code.manifest
+        }
+        changed_size = sum(sizes[local_path] for local_path, _ in changed)
+        if changed_size > DELTA_MAX_RATIO * sum(sizes.values()):
+            LOGGER.info("Code changed too much to send delta; sending whole archive")
+            return
+        arcnames = {arcname for _, arcname, _ in code.manifest}
+        code.base_path = Path(base_path)
+        code.delta = [PathToDump(Path(p), Path(a)) for p, a in changed]
+        code.deleted = [arcname for arcname in base_manifest if arcname not in arcnames]
+        LOGGER.info(
+            "Sending %d changed files (%d bytes) against %s; %d files deleted",
+            len(changed),
+            changed_size,
+            code.base_path,
+            len(code.deleted),
         )
-        with tempfile.NamedTemporaryFile(suffix=".tar.gz") as temp_file:
-            # archive all files
-            with tarfile.open(temp_file.name, "w:gz") as tar_file:
-                for p in paths_to_dump:
-                    LOGGER.debug(
-                        'Adding "%s" to deployment archive', str(p.rel_remote_path)
-                    )
-                    try:
-                        tar_file.add(p.local_path, arcname=p.rel_remote_path)
-                    except PermissionError:
-                        LOGGER.warning("Skipping %s: no access", str(p.local_path))
 
-            # upload archive to cluster and extract
-            self._put(temp_file.name, archive_remote_path)
+    def deploy_code(self, experiment, batch, code):
+        """Extracts code into experiment_scratch_dir; cached archive is extracted on the
+        cluster, otherwise archive is streamed, stored in the cache and extracted on the
+        fly. Delta is extracted over the base archive, which is then archived again.
+        With node_local_dir set, the archive is only stored."""
+        if code is None:
+            return
 
-    def deploy_code(self, experiment, archive_remote_path):
-        if not experiment.send_code:
+        if code.git_head:
+            self._checkout_code(experiment, batch, code)
+        elif experiment.code_store:
+            self._link_code(experiment, batch, code)
+        else:
+            # with node-local staging tasks extract the archive themselves
+            extract_cmd = (
+                None
+                if experiment.node_local_dir
+                else self._extract_cmd(code.codec, experiment.experiment_scratch_dir)
+            )
+            if not code.cached:
+                self._upload_code(experiment, batch, code, extract_cmd)
+            else:
+                # mtime of archive is time of its last use, for garbage collection
+                batch.add(
+                    "extract_code",
+                    f"touch {code.remote_path}"
+                    + (
+                        f" && {extract_cmd} < {code.remote_path}" if extract_cmd else ""
+                    ),
+                )
+        if experiment.code_sharing != CODE_SHARING_COPY:
+            # tree is shared by all array tasks, none of them may modify it
+            batch.add(
+                "protect_code", f"chmod -R a-w {experiment.experiment_scratch_dir}"
+            )
+
+    @staticmethod
+    def _excluded_paths(experiment):
+        """Excluded paths inside project, relative to its root"""
+        excluded = [Path(e).relpath(experiment.cwd) for e in (experiment.exclude or [])]
+        return [e for e in excluded if e != "." and not e.startswith("..")]
+
+    @staticmethod
+    def _checkout_code(experiment, batch, code):
+        """Fetches bundle into git mirror and checks out code with uncommitted changes
+        in experiment_scratch_dir"""
+        tree = experiment.experiment_scratch_dir
+        mirror = experiment.git_mirror_dir
+        if code.git_bundle:
+            batch.add_file("store_code_bundle", f"{tree}.bundle", code.git_bundle)
+            batch.add(
+                "fetch_code_bundle",
+                f"([ -d {mirror} ] || git init -q --bare {mirror}) && "
+                f"git -C {mirror} fetch -q {tree}.bundle "
+                f"HEAD:{SHIPPED_REFS}/{code.git_head} && rm {tree}.bundle",
+            )
+        batch.add(
+            "checkout_code",
+            f"set -o pipefail && git -C {mirror} archive {code.git_head} "
+            f"| tar -x -f - -C {tree}",
+        )
+        if code.git_diff:
+            batch.add_file("store_code_diff", f"{tree}.diff", code.git_diff)
+            batch.add(
+                "apply_code_diff",
+                f"cd {tree} && git apply --binary --whitespace=nowarn {tree}.diff "
+                f"&& rm {tree}.diff",
+            )
+        # excluded files are removed, as they are in git tree
+        excluded = SlurmBackend._excluded_paths(experiment)
+        if excluded:
+            batch.add_with_input(
+                "remove_excluded_code",
+                f"cd {tree} && xargs -0 rm -rf --",
+                "\0".join(excluded).encode("utf-8"),
+            )
+
+    def _link_code(self, experiment, batch, code):
+        """Uploads objects missing in store and materialises code in
+        experiment_scratch_dir as hard links to objects"""
+        links = io.BytesIO()
+        write_links_archive(
+            links,
+            code.manifest,
+            experiment.experiment_scratch_dir.relpath(experiment.scratch_dir),
+            OBJECTS_DIR_NAME,
+        )
+        link_cmd = f"tar -x -z -f - -C {experiment.scratch_dir}"
+        if not code.missing_objects:
+            batch.add_with_input("link_code", link_cmd, links.getvalue())
             return
-        cd = f"cd {experiment.experiment_scratch_dir} ;  "
-        self._fabric_run(
-            cd
-            + "tar xvf {tar_filename} > /dev/null".format(
-                tar_filename=archive_remote_path
+
+        # links may be created only after objects are stored, which is the last step
+        # reading input
+        links_path = f"{experiment.experiment_scratch_dir}.links.tar.gz"
+        batch.add_file("store_code_links", links_path, links.getvalue())
+        batch.add_stream(
+            "upload_objects",
+            f"{store_objects_cmd(experiment.objects_dir, code.codec.tar_options)} && "
+            f"{link_cmd} < {links_path} && rm {links_path}",
+            self._archive_writer(
+                [
+                    PathToDump(Path(local_path), Path(name))
+                    for name, local_path in sorted(code.missing_objects.items())
+                ],
+                code.codec,
+                experiment.archive_level,
+            ),
+        )
+
+    def _upload_code(self, experiment, batch, code, extract_cmd):
+        # manifest is stored next to archive, so the next upload may be a delta
+        manifest_path = f"{code.remote_base}.manifest"
+        batch.add_file(
+            "store_code_manifest",
+            f"{manifest_path}.part",
+            json.dumps({arcname: entry for _, arcname, entry in code.manifest}).encode(
+                "utf-8"
+            ),
+        )
+        store_manifest_cmd = f"mv {manifest_path}.part {manifest_path}"
+        if code.base_path is not None:
+            tree = (
+                experiment.experiment_scratch_dir
+                if extract_cmd
+                else Path(f"{code.remote_base}.tree")
             )
+            batch.add(
+                "extract_base_code",
+                f"mkdir -p {tree} && "
+                f"{self._extract_cmd(get_codec_by_path(code.base_path), tree)} "
+                f"< {code.base_path}",
+            )
+            if code.deleted:
+                batch.add_with_input(
+                    "remove_deleted_code",
+                    f"cd {tree} && xargs -0 rm -rf --",
+                    "\0".join(code.deleted).encode("utf-8"),
+                )
+            cleanup_cmd = "" if extract_cmd else f" && rm -rf {tree}"
+            batch.add_stream(
+                "upload_code_delta",
+                f"{self._extract_cmd(code.codec, tree)} && "
+                f"tar -c {code.codec.tar_options} {GNU_TAR_NORMALIZE_OPTIONS} "
+                f"-f {code.remote_path}.part -C {tree} . && mv {code.remote_path}.part {code.remote_path} && "
+                f"{store_manifest_cmd}{cleanup_cmd}",
+                self._archive_writer(code.delta, code.codec, experiment.archive_level),
+            )
+        else:
+            store_cmd = (
+                f"set -o pipefail && tee {code.remote_path}.part | {extract_cmd}"
+                if extract_cmd
+                else f"cat > {code.remote_path}.part"
+            )
+            # store under temporary name, so interrupted upload is never reused
+            batch.add_stream(
+                "upload_code",
+                f"{store_cmd} && mv {code.remote_path}.part {code.remote_path} && "
+                f"{store_manifest_cmd}",
+                self._archive_writer(
+                    code.paths_to_dump, code.codec, experiment.archive_level
+                ),
+            )
+
+    def deploy_configs(self, experiment, batch):
+        configs_dir = experiment.cmd._experiment_config_path.dirname()
+        codec = get_codec(
+            "gzip" if experiment.compression == AUTO_CODEC else experiment.compression
         )
-        self._fabric_run(
-            f"mv {experiment.experiment_scratch_dir}/{TMP_CONFIGS_DIR} {experiment.grid_configs_dir}"
+        payload = io.BytesIO()
+        self._archive_writer(
+            [PathToDump(configs_dir, Path("."))], codec, experiment.archive_level
+        )(payload)
+        batch.add_with_input(
+            "deploy_configs",
+            f"mkdir -p {experiment.grid_configs_dir} && "
+            f"{self._extract_cmd(codec, experiment.grid_configs_dir)}",
+            payload.getvalue(),
         )
 
-    def send_script(self, script, remote_script_path):
-        self._put(script.path, remote_script_path)
+    def send_script(self, script, remote_script_path, batch, name="send_script"):
+        batch.add_file(name, remote_script_path, script.path.bytes(), "a+x")
+
+    def _choose_codec(self, experiment, paths_to_dump):
+        if experiment.compression != AUTO_CODEC:
+            return get_codec(experiment.compression)
+        files = iter_files_to_dump(paths_to_dump)
+        total_size = sum(local_path.lstat().st_size for local_path, _ in files)
+        if experiment.slurm_url not in self.throughput_cache:
+            self.throughput_cache[experiment.slurm_url] = self._measure_throughput()
+        return choose_codec(
+            read_sample(files),
+            total_size,
+            self.throughput_cache[experiment.slurm_url],
+        )
+
+    def _measure_throughput(self, probe_size=THROUGHPUT_PROBE_SIZE):
+        payload = os.urandom(probe_size)
+        start = time.perf_counter()
+        exit_status, _, stderr = run_with_stdin(
+            self.connection,
+            "cat > /dev/null",
+            lambda writer: writer.write(payload),
+        )
+        if exit_status != 0:
+            raise RuntimeError(f"Could not measure link throughput: {stderr}")
+        throughput = probe_size / (time.perf_counter() - start)
+        LOGGER.info("Measured link throughput: %.1f MB/s", throughput / 1e6)
+        return throughput
 
-    def _put(self, local_path, remote_path):
-        LOGGER.info("SSH: put local file %s as remote %s", local_path, remote_path)
-        self.connection.put(local_path, remote_path)
+    @staticmethod
+    def _extract_cmd(codec, directory):
+        return f"tar -x {codec.tar_options} -f - -C {directory}"
 
-    def _ensure_dir(self, directory_path):
-        self._fabric_run("mkdir -p {path}".format(path=directory_path))
+    @staticmethod
+    def _archive_writer(paths_to_dump, codec, level=None):
+        """Returns function writing archive of paths_to_dump to file-like object, so
+        the archive can be streamed while it is being created"""
 
-    def _fabric_run(self, cmd, warn=False):
+        def _write_archive(writer):
+            with open_archive_stream(writer, codec, level) as tar_file:
+                # paths_to_dump is a set, members are sorted for reproducible archive
+                for p in sorted(paths_to_dump, key=lambda p: str(p.rel_remote_path)):
+                    LOGGER.debug(
+                        'Adding "%s" to deployment archive', str(p.rel_remote_path)
+                    )
+                    try:
+                        add_to_archive(tar_file, p.local_path, p.rel_remote_path)
+                    except PermissionError:
+                        LOGGER.warning("Skipping %s: no access", str(p.local_path))
+
+        return _write_archive
+
+    def _fabric_run(self, cmd, warn=False, hide=False):
         LOGGER.info("SSH: running command '%s'", cmd)
-        return self.connection.run(cmd, warn=warn)
+        return self.connection.run(cmd, warn=warn, hide=hide)
 
-    def _file_exists(self, fname):
-        return self._fabric_run(f"stat {fname}", warn=True).ok
+
+@attr.s
+class _CodeArchive(object):
+    paths_to_dump = attr.ib()
+    remote_base = attr.ib()
+    manifest = attr.ib(default=None)
+    remote_path = attr.ib(default=None)
+    codec = attr.ib(default=None)
+    cached = attr.ib(default=False)
+    # commit shipped in git bundle, with uncommitted changes as binary diff
+    git_head = attr.ib(default=None)
+    git_bundle = attr.ib(default=None)
+    git_diff = attr.ib(default=None)
+    # objects missing in code store, by name, with local paths of their files
+    missing_objects = attr.ib(default=None)
+    # previous archive which is updated with delta, instead of uploading whole code
+    base_path = attr.ib(default=None)
+    delta = attr.ib(default=None)
+    deleted = attr.ib(factory=list)
 
 
 _slurm_backend = None
@@ -63,7 +63,7 @@ def context(ctx):
 @click.option(
     "--backend_type",
     required=True,
-    type=click.Choice(["kubernetes", "slurm"]),
+    type=click.Choice(["kubernetes", "slurm", "local"]),
     help="Type of backend",
 )
 @click.option(
@@ -1,19 +1,23 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import json
 import logging
 import tempfile
+import time
 import traceback
+from collections import Counter
 from pprint import pformat
 
 import click
 from path import Path
 
 from mrunner import __version__
-from mrunner.backends import get_backend
+from mrunner.backends import SubmissionError, get_backend
 from mrunner.cli.config import ConfigParser
 from mrunner.cli.config import context as context_cli
 from mrunner.experiment import generate_experiments
+from mrunner.utils.manifest import SweepManifest
 from mrunner.utils.utils import WrapperCmd, validate_context
 
 LOGGER = logging.getLogger(__name__)
@@ -119,7 +123,7 @@ def cli(ctx, verbose, config, context, **kwargs):
     LOGGER.debug("Using {} as mrunner config".format(config_path))
     config = ConfigParser(config_path).load()
 
-    cmd_require_context = ctx.invoked_subcommand not in ["context"]
+    cmd_require_context = ctx.invoked_subcommand not in ["context", "status"]
     if cmd_require_context:
         context_name = context or config.current_context or None
         if not context_name:
@@ -189,6 +193,8 @@ def run(ctx, spec, script, params):
             )
             ok = True
             break
+        except SubmissionError:
+            raise
         except Exception as e:
             LOGGER.error(
                 "Caught exception: %s. Retrying until %d times.\n%s",
@@ -207,6 +213,87 @@ def run(ctx, spec, script, params):
             callback(sweep, experiments)
 
 
+def _task_configs(task):
+    """Ids of configs of manifest entry; entry of lazy grid without task id stands
+    for all configs of its job"""
+    if task["task_id"] is None:
+        first, last = json.loads(task["parameters"])["configs"]
+        return range(first, last + 1)
+    return [task["config_id"]]
+
+
+@cli.command()
+@click.option(
+    "--ttl",
+    default=60,
+    show_default=True,
+    help="Seconds for which cached job states are not refreshed",
+)
+@click.option(
+    "--configs", "show_configs", is_flag=True, help="Show state of each config"
+)
+@click.argument("unique_names", nargs=-1)
+def status(ttl, show_configs, unique_names):
+    """Show states of submitted sweeps"""
+    manifest = SweepManifest()
+    # one query per cluster for all tracked jobs
+    for cluster, job_ids in manifest.stale_jobs(unique_names, ttl).items():
+        try:
+            states = get_backend("slurm").query_states(cluster, job_ids)
+        except Exception as e:
+            LOGGER.warning("Could not query job states on %s: %s", cluster, e)
+            continue
+        manifest.update_states(job_ids, states)
+
+    for sweep in manifest.sweeps(unique_names):
+        tasks = manifest.tasks(sweep["unique_name"])
+        counts = Counter()
+        for task in tasks:
+            counts[task["state"]] += len(_task_configs(task))
+        submitted = time.strftime("%Y-%m-%d %H:%M", time.localtime(sweep["submitted"]))
+        click.echo(
+            f"{sweep['unique_name']}  {sweep['name']}  {submitted}  "
+            + ", ".join(f"{state}: {count}" for state, count in sorted(counts.items()))
+        )
+        if show_configs:
+            for task in tasks:
+                job = f"{task['job_id']}_{task['task_id']}" if task["job_id"] else "-"
+                config = f"config_{task['config_id']}"
+                if task["task_id"] is None:
+                    configs = _task_configs(task)
+                    job = task["job_id"] or "-"
+                    config = f"configs_{configs[0]}-{configs[-1]}"
+                click.echo(f"  {config}  {task['state']}  {job}  {task['task_dir']}")
+    manifest.close()
+
+
+@cli.command()
+@click.option(
+    "--max-bytes",
+    default=None,
+    help="Budget of scratch directory, e.g. 500G (default: gc_max_bytes of context)",
+)
+@click.option(
+    "--max-inodes",
+    default=None,
+    type=int,
+    help="Budget of inodes (default: gc_max_inodes of context)",
+)
+@click.pass_context
+def gc(ctx, max_bytes, max_inodes):
+    """Remove least recently used sweep directories and cached code not used by
+    queued jobs, to fit in budget, and files of code store no sweep uses"""
+    context = ctx.obj["context"]
+    if context["backend_type"] != "slurm":
+        raise click.ClickException("gc is supported only by slurm backend")
+    evicted, removed_objects = get_backend("slurm").collect_garbage(
+        context, max_bytes=max_bytes, max_inodes=max_inodes
+    )
+    for entry in evicted:
+        click.echo(f"Removed {entry.path} ({entry.bytes} bytes, {entry.inodes} inodes)")
+    click.echo(f"Removed {removed_objects} unused objects from code store")
+
+
 cli.add_command(context_cli)
 
 if __name__ == "__main__":
@@ -8,8 +8,14 @@ import cloudpickle
 from attrs import Factory, define, field
 from path import Path
 
-from mrunner.utils.namesgenerator import get_random_name, get_unique_name
-from mrunner.utils.utils import WrapperCmd
+from mrunner.utils.config_pack import (
+    CONFIG_PACK_NAME,
+    write_config_pack,
+    write_grid_pack,
+)
+from mrunner.utils.namesgenerator import get_random_name, get_unique_name, id_generator
+from mrunner.utils.param_grid import as_param_grid
+from mrunner.utils.utils import WrapperCmd, pathify
 
 LOGGER = logging.getLogger(__name__)
 
@@ -21,6 +27,8 @@ class ContextBase:
     storage_dir: Path
     cmd: WrapperCmd = None
     cwd: Path = Factory(Path.getcwd)
+    # configs of all experiments stored in one file instead of one file per experiment
+    config_pack: bool = False
 
 
 def values_to_str(d: dict[str, Any]) -> dict[str, str]:
@@ -44,11 +52,54 @@ class Experiment(object):
     with_mpi: Any = field(default=False)
     restore_from_path: Any = field(default=None)
     send_code: Any = field(default=True)
+    # backend resources (e.g. cpu, mem, time) overriding those of the context
+    resources: dict = field(factory=dict)
+    # grid of parameters combined with parameters lazily, on the node running config
+    params_grid: Any = field(default=None)
 
     def to_dict(self):
         return attr.asdict(self)
 
 
+class ScratchLayoutMixin(object):
+    """Layout of sweep directories under storage_dir, shared by backends running
+    experiments from scratch directories: code in experiment_scratch_dir, own copy
+    of it for each config (experiment_scratch_dir_<config id>), configs and logs"""
+
+    @property
+    def scratch_dir(self):
+        return Path(self.storage_dir) / pathify(self.scratch_dir_name)
+
+    @property
+    def cache_dir(self):
+        return self.scratch_dir / pathify(self.cache_dir_name)
+
+    @property
+    def project_scratch_dir(self):
+        return self.scratch_dir / pathify(self.project.split("/")[-1])
+
+    @property
+    def grid_scratch_dir(self):
+        return self.project_scratch_dir / pathify(self.unique_name)
+
+    @property
+    def experiment_scratch_dir(self):
+        if self._experiment_scratch_dir is None:
+            # TODO(pj): Change id_generator to hyper-params shorthand
+            self._experiment_scratch_dir = self.grid_scratch_dir / pathify(
+                self.name + "_" + id_generator(4)
+            )
+        return self._experiment_scratch_dir
+
+    @property
+    def grid_logs_dir(self):
+        return self.grid_scratch_dir / self.grid_logs_dir_name
+
+    @property
+    def grid_configs_dir(self):
+        return self.grid_scratch_dir / self.grid_configs_dir_name
+
+
 def _merge_experiment_parameters(cli_kwargs, context):
     config = context.copy()
     for k, v in cli_kwargs.items():
@@ -72,7 +123,7 @@ def _merge_experiment_parameters(cli_kwargs, context):
     return config
 
 
-def _load_py_experiment(script, spec, *, dump_dir: Path):
+def _load_py_experiment(script, spec, *, dump_dir: Path, config_pack=False):
     LOGGER.info(
         "Found {} function in {}; will use it as experiments configuration generator".format(
             spec, script
@@ -87,19 +138,62 @@ def _load_py_experiment(script, spec, *, dump_dir: Path):
         return config_path
 
     experiments_list = get_experiments_list(script, spec)
-    for idx, experiment in enumerate(experiments_list):
+    if any(experiment.params_grid is not None for experiment in experiments_list):
+        yield from _load_lazy_grid(experiments_list, dump_dir=dump_dir)
+        return
+
+    specs_params = []
+    for experiment in experiments_list:
         spec_params = experiment.to_dict()
         spec_params["name"] = re.sub(r"[ .,_:;-]+", "-", spec_params["name"].lower())
+        specs_params.append(spec_params)
+
+    if config_pack:
+        config_path = dump_dir / CONFIG_PACK_NAME
+        write_config_pack(config_path, specs_params)
+        for spec_params in specs_params:
+            yield config_path, spec_params
+        return
 
+    for idx, spec_params in enumerate(specs_params):
         config_path = _create_and_dump_config(spec_params, dump_dir, idx)
 
         yield config_path, spec_params
 
 
+def _load_lazy_grid(experiments_list, *, dump_dir: Path):
+    """Yields lazy grid experiment once, with number of configs of its grid as
+    num_configs; instead of configs, only the experiment and its grid are dumped,
+    into grid pack"""
+    if len(experiments_list) != 1:
+        raise ValueError("Lazy grid experiment has to be the only one in the list")
+    spec_params = experiments_list[0].to_dict()
+    spec_params["name"] = re.sub(r"[ .,_:;-]+", "-", spec_params["name"].lower())
+    params_grid = as_param_grid(spec_params.pop("params_grid"))
+
+    config_path = dump_dir / CONFIG_PACK_NAME
+    write_grid_pack(config_path, dict(spec_params, params_grid=None), params_grid)
+    # configs are not enumerated, so submission does not depend on size of grid
+    yield config_path, dict(spec_params, num_configs=len(params_grid))
+
+
+def get_num_configs(experiments):
+    """Number of configs of sweep; lazy grid experiment stands for all configs of
+    its grid"""
+    if len(experiments) == 1 and experiments[0].get("num_configs"):
+        return experiments[0]["num_configs"]
+    return len(experiments)
+
+
 def generate_experiments(
     script: str, context: dict, *, spec="spec", dump_dir=None
 ) -> Generator[tuple[str, dict], Any, None]:
-    experiments = _load_py_experiment(script, spec=spec, dump_dir=dump_dir)
+    experiments = _load_py_experiment(
+        script,
+        spec=spec,
+        dump_dir=dump_dir,
+        config_pack=context.get("config_pack", False),
+    )
 
     for config_path, spec_params in experiments:
         experiment = _merge_experiment_parameters(spec_params, context)
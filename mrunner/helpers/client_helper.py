@@ -11,6 +11,8 @@ from dataclasses import is_dataclass, asdict
 import cloudpickle
 from munch import Munch
 
+from mrunner.utils.config_pack import is_config_pack, parse_config_ref, read_config
+
 experiment_ = None
 logger_ = logging.getLogger(__name__)
 
@@ -116,8 +118,12 @@ def get_configuration(
     # This is here for running remotely, load experiment from dump
     if configuration is not None:
         logger_.info("File to load:{}".format(configuration))
-        with open(configuration, "rb") as f:
-            experiment = Munch(cloudpickle.load(f))
+        config_path, config_index = parse_config_ref(configuration)
+        if config_index is not None and is_config_pack(config_path):
+            experiment = Munch(read_config(config_path, config_index))
+        else:
+            with open(configuration, "rb") as f:
+                experiment = Munch(cloudpickle.load(f))
         params = Munch(experiment["parameters"])
         git_info = experiment.get("git_info", None)
         if git_info:
@@ -235,4 +241,3 @@ def logger(m, v, single_value=False):
                 experiment_[m].append(v)
     else:
         print("{}:{}".format(m, v))
-
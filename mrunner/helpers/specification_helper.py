@@ -1,13 +1,14 @@
 import copy
 import os
 import pathlib
+import re
 import warnings
 from collections import OrderedDict
 from collections.abc import Mapping
 from itertools import product
-from typing import List
+from typing import Callable, List, Union
 
-from gitignore_parser import parse_gitignore
+from gitignore_parser import rule_from_pattern
 from munch import Munch
 from neptune.common.utils import get_git_info
 from termcolor import colored
@@ -15,6 +16,7 @@ from termcolor import colored
 import mrunner.plugins as plugins
 from mrunner.experiment import Experiment
 from mrunner.utils.namesgenerator import get_random_name
+from mrunner.utils.param_grid import ParamGrid, as_param_grid
 
 
 def create_experiments_helper(
@@ -37,6 +39,8 @@ def create_experiments_helper(
     with_mpi: bool = False,
     callbacks: list = None,
     mrunner_ignore: str = None,
+    resources: Union[dict, Callable[[dict], dict]] = None,
+    lazy_grid: bool = False,
 ):
 
     assert (
@@ -87,8 +91,17 @@ def create_experiments_helper(
         if display_neptune_link:
             spec = project_name.split("/")
 
-    params_configurations = get_combinations(params_grid)
-    print(colored(f"Will run {len(params_configurations)} experiments", "red"))
+    if lazy_grid:
+        # configs are computed from base_config and params_grid on the nodes
+        num_experiments = len(as_param_grid(params_grid))
+    else:
+        params_configurations = (
+            params_grid
+            if isinstance(params_grid, ParamGrid)
+            else get_combinations(params_grid)
+        )
+        num_experiments = len(params_configurations)
+    print(colored(f"Will run {num_experiments} experiments", "red"))
     experiments = []
 
     git_info = None
@@ -112,6 +125,35 @@ def create_experiments_helper(
                 f"in mrunner.plugins, got {callback}"
             )
         callback(**locals())
+
+    if lazy_grid:
+        if "restore_from_path" in base_config or any(
+            key.startswith("restore_from_path")
+            for key in as_param_grid(params_grid).keys
+        ):
+            raise ValueError("restore_from_path is not supported with lazy_grid")
+        if callable(resources):
+            raise ValueError(
+                "resources depending on config are not supported with lazy_grid"
+            )
+        return [
+            Experiment(
+                project=project_name,
+                name=experiment_name,
+                script=script,
+                parameters=Munch(copy.deepcopy(base_config)),
+                params_grid=params_grid,
+                paths_to_copy=paths_to_copy,
+                tags=tags,
+                env=env,
+                exclude=exclude,
+                git_info=git_info,
+                random_name=random_name,
+                with_mpi=with_mpi,
+                resources=dict(resources or {}),
+            )
+        ]
+
     for params_configuration in params_configurations:
         config = copy.deepcopy(base_config)
         config.update(params_configuration)
@@ -121,6 +163,10 @@ def create_experiments_helper(
         if "restore_from_path" in config:
             restore_from_path = config.pop("restore_from_path")
             send_code = config.pop("send_code")
+        # resources may depend on config, e.g. more memory for larger models
+        experiment_resources = (
+            resources(config) if callable(resources) else resources
+        ) or {}
 
         experiments.append(
             Experiment(
@@ -137,6 +183,7 @@ def create_experiments_helper(
                 with_mpi=with_mpi,
                 restore_from_path=restore_from_path,
                 send_code=send_code,
+                resources=dict(experiment_resources),
             )
         )
 
@@ -176,67 +223,74 @@ def get_combinations(param_grids, limit=None):
         # dicts.
         param_grids = [param_grids]
 
-    combinations = []
     for param_grid in param_grids:
-        items = param_grid.items()
-        if not items:
-            combinations.append(OrderedDict())
-        else:
-            keys___ = []
-            grids___ = []
-            keys = []
-            grids = []
-
-            for key, grid in items:
-                if "___" in key:
-                    keys___.append(key[:-3])
-                    grids___.append(grid)
-                else:
-                    keys.append(key)
-                    grids.append(grid)
-
-            for grid in grids + grids___:
-                assert isinstance(
-                    grid, allowed_container_types
-                ), "grid values should be passed in one of given types: {}, got {} ({})".format(
-                    allowed_container_types, type(grid), grid
-                )
-
-            if grids___:
-                for param_values___ in zip(*grids___):
-                    for param_values in product(*grids):
-                        combination = OrderedDict(
-                            zip(keys___ + keys, param_values___ + param_values)
-                        )
-                        combinations.append(combination)
-            else:
-                for param_values in product(*grids):
-                    combination = OrderedDict(zip(keys, param_values))
-                    combinations.append(combination)
+        for grid in param_grid.values():
+            assert isinstance(
+                grid, allowed_container_types
+            ), "grid values should be passed in one of given types: {}, got {} ({})".format(
+                allowed_container_types, type(grid), grid
+            )
 
+    # combinations are computed lazily, so only those within limit are built
+    combinations = ParamGrid(param_grids)
     if limit:
         combinations = combinations[:limit]
-    return combinations
+    return list(combinations)
+
+
+def compile_mrunnerignore(mrunnerignore_path):
+    """Compiles patterns of .mrunnerignore file (gitignore syntax) into function
+    telling if path, relative to directory of that file, is ignored; the last
+    matching pattern decides, as in git"""
+    base_dir = os.path.dirname(os.path.abspath(mrunnerignore_path))
+    with open(mrunnerignore_path) as f:
+        rules = [rule_from_pattern(line.rstrip("\n"), base_path=base_dir) for line in f]
+    rules = [
+        (re.compile(rule.regex), rule.negation, rule.directory_only)
+        for rule in reversed([rule for rule in rules if rule])
+    ]
+
+    def is_ignored(rel_path, is_dir=False):
+        for regex, negation, directory_only in rules:
+            if directory_only and not is_dir:
+                continue
+            # negated directory patterns match only paths with trailing slash
+            if regex.search(
+                rel_path + "/" if negation and directory_only else rel_path
+            ):
+                return not negation
+        return False
+
+    return is_ignored
 
 
 def find_files_with_mrunnerignore(base_path, mrunnerignore_path):
-    # Create a GitignoreParser object
-    gitignore = parse_gitignore(mrunnerignore_path)
+    """Lists paths under base_path ignored by .mrunnerignore file; ignored
+    directories are listed as a whole and not walked into (as in git, files in them
+    cannot be re-included)"""
+    is_ignored = compile_mrunnerignore(mrunnerignore_path)
+    base_dir = os.path.dirname(os.path.abspath(mrunnerignore_path))
+    # patterns are matched against paths relative to directory of .mrunnerignore
+    prefix = os.path.relpath(os.path.abspath(base_path), base_dir)
 
-    # List to store matched files
     matched_paths = []
-
-    # Walk through the directory tree starting from the base path
     for root, dirs, files in os.walk(base_path):
-        # Check if the current directory should be ignored
-        if gitignore(root):
-            matched_paths.append(os.path.relpath(root, base_path))
-            continue
-
-        # Check if each file in the current directory should be ignored
-        files = [f for f in files if gitignore(os.path.join(root, f))]
-
-        # Add the remaining files to the matched_files list
-        matched_paths.extend([os.path.join(root, f) for f in files])
+        rel_root = os.path.normpath(
+            os.path.join(prefix, os.path.relpath(root, base_path))
+        )
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        kept_dirs = []
+        for d in dirs:
+            if is_ignored(rel_root + d, is_dir=True):
+                matched_paths.append(os.path.normpath(os.path.join(root, d)))
+            else:
+                kept_dirs.append(d)
+        # pruning dirs in place stops os.walk from entering ignored directories
+        dirs[:] = kept_dirs
+        matched_paths.extend(
+            os.path.normpath(os.path.join(root, f))
+            for f in files
+            if is_ignored(rel_root + f)
+        )
 
     return matched_paths
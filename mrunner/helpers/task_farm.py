@@ -0,0 +1,180 @@
+"""Task farm running configs of a sweep inside one allocation.
+
+Coordinator hands out config indices to workers as they become free, so fast and
+slow configs balance automatically. Workers run the given command with
+MRUNNER_CONFIG_ID set to the index of the config.
+
+Example (within Slurm allocation, one coordinator and ntasks - 1 workers)::
+
+    srun python -m mrunner.helpers.task_farm --mpi --num-configs 100 -- bash run.sh
+
+Example (local processes, e.g. for testing)::
+
+    python -m mrunner.helpers.task_farm --workers 4 --num-configs 100 -- bash run.sh
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from multiprocessing.connection import wait
+
+logger_ = logging.getLogger(__name__)
+
+
+def run_config(command, config_id):
+    """Runs command for one config; returns its exit code"""
+    env = dict(os.environ, MRUNNER_CONFIG_ID=str(config_id))
+    start = time.time()
+    returncode = subprocess.call(command, env=env)
+    logger_.info(
+        "Config %d finished with code %d in %.1fs",
+        config_id,
+        returncode,
+        time.time() - start,
+    )
+    return returncode
+
+
+def coordinate(recv, send, num_workers, config_ids):
+    """Hands out config_ids to workers on request, until all are done.
+
+    recv() returns (worker, result) for a worker asking for work, where result is
+    None for the first request and (config_id, exit code) of the previous config
+    otherwise; send(worker, config_id) replies, with None meaning stop.
+    Returns list of ids of failed configs.
+    """
+    pending = iter(config_ids)
+    active = num_workers
+    failed = []
+    while active:
+        worker, result = recv()
+        if result is not None and result[1] != 0:
+            failed.append(result[0])
+        config_id = next(pending, None)
+        send(worker, config_id)
+        if config_id is None:
+            active -= 1
+    return failed
+
+
+def work(send, recv, run):
+    """Asks coordinator for configs and runs them until told to stop"""
+    result = None
+    while True:
+        send(result)
+        config_id = recv()
+        if config_id is None:
+            return
+        result = (config_id, run(config_id))
+
+
+def _local_worker(conn, command):
+    work(conn.send, conn.recv, lambda config_id: run_config(command, config_id))
+    conn.close()
+
+
+def run_local(command, config_ids, num_workers):
+    """Runs configs in num_workers local processes connected with pipes"""
+    connections = []
+    processes = []
+    for _ in range(num_workers):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_local_worker, args=(child_conn, command)
+        )
+        process.start()
+        connections.append(parent_conn)
+        processes.append(process)
+
+    ready = []
+
+    def _recv():
+        while not ready:
+            ready.extend(wait(connections))
+        conn = ready.pop()
+        return conn, conn.recv()
+
+    def _send(conn, config_id):
+        conn.send(config_id)
+        if config_id is None:
+            # stopped worker closes its end, it must not be waited for anymore
+            connections.remove(conn)
+
+    failed = coordinate(_recv, _send, num_workers, config_ids)
+    for process in processes:
+        process.join()
+    return failed
+
+
+def run_mpi(command, config_ids):
+    """Runs configs on MPI ranks; rank 0 coordinates, the other ranks work"""
+    try:
+        from mpi4py import MPI
+    except ImportError as e:
+        logger_.error("Install 'mpi4py' to run task farm with MPI.")
+        raise e
+
+    comm = MPI.COMM_WORLD
+    if comm.Get_size() < 2:
+        raise RuntimeError("Task farm with MPI requires at least 2 ranks")
+
+    if comm.Get_rank() == 0:
+
+        def _recv():
+            status = MPI.Status()
+            result = comm.recv(source=MPI.ANY_SOURCE, status=status)
+            return status.Get_source(), result
+
+        failed = coordinate(
+            _recv,
+            lambda rank, msg: comm.send(msg, dest=rank),
+            comm.Get_size() - 1,
+            config_ids,
+        )
+    else:
+        work(
+            lambda msg: comm.send(msg, dest=0),
+            lambda: comm.recv(source=0),
+            lambda config_id: run_config(command, config_id),
+        )
+        failed = []
+    return comm.bcast(failed, root=0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run sweep configs as a task farm.")
+    parser.add_argument("--num-configs", type=int, required=True)
+    parser.add_argument("--first-config", type=int, default=0)
+    parser.add_argument("--mpi", action="store_true", help="Use MPI ranks as workers")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of local worker processes (without --mpi)",
+    )
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("command to run is required")
+    config_ids = range(args.first_config, args.first_config + args.num_configs)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.mpi:
+        failed = run_mpi(command, config_ids)
+    else:
+        failed = run_local(command, config_ids, args.workers)
+
+    if failed:
+        logger_.error("Failed configs: %s", " ".join(map(str, sorted(failed))))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+import logging
+import stat
+import tarfile
+import time
+import zlib
+from contextlib import contextmanager
+
+import attr
+
+LOGGER = logging.getLogger(__name__)
+
+AUTO_CODEC = "auto"
+SAMPLE_SIZE = 16 * 1024 * 1024  # bytes of code used to benchmark codecs in auto mode
+# mtime of all archive members (1980-01-01), as in reproducible builds of wheels
+ARCHIVE_MTIME = 315532800
+# options making GNU tar normalize members as normalize_tarinfo does
+GNU_TAR_NORMALIZE_OPTIONS = (
+    f"--sort=name --mtime=@{ARCHIVE_MTIME} --owner=0 --group=0 --numeric-owner "
+    "--mode=u=rwX,go=rX"
+)
+
+
+@attr.s(frozen=True)
+class Codec(object):
+    """Compression codec of deployment archives
+
+    tar_options are passed to remote `tar` to extract archives made with the codec.
+    """
+
+    name = attr.ib()
+    suffix = attr.ib()
+    tar_options = attr.ib()
+    default_level = attr.ib(default=None)
+
+    def compressor(self, level=None):
+        level = self.default_level if level is None else level
+        if self.name == "none":
+            return _NoCompressor()
+        if self.name == "gzip":
+            # wbits=31 produces gzip container, with zeroed mtime in header
+            return zlib.compressobj(level, zlib.DEFLATED, 31)
+        if self.name == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                LOGGER.error("Install 'zstandard' to use zstd compression.")
+                raise e
+            # threads=-1 uses all cores; output does not depend on number of threads
+            return zstandard.ZstdCompressor(level=level, threads=-1).compressobj()
+        if self.name == "lz4":
+            try:
+                import lz4.frame
+            except ImportError as e:
+                LOGGER.error("Install 'lz4' to use lz4 compression.")
+                raise e
+            return _LZ4Compressor(lz4.frame.LZ4FrameCompressor(compression_level=level))
+        raise ValueError(f"Unsupported compression codec: {self.name}")
+
+    @property
+    def available(self):
+        try:
+            self.compressor()
+        except ImportError:
+            return False
+        return True
+
+
+CODECS = {
+    codec.name: codec
+    for codec in [
+        Codec("none", ".tar", ""),
+        Codec("gzip", ".tar.gz", "-z", default_level=6),
+        Codec("zstd", ".tar.zst", "-I zstd", default_level=3),
+        Codec("lz4", ".tar.lz4", "-I lz4", default_level=0),
+    ]
+}
+COMPRESSION_MODES = list(CODECS) + [AUTO_CODEC]
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported compression codec: {name}; "
+            f"choose one of: {', '.join(COMPRESSION_MODES)}"
+        )
+
+
+def get_codec_by_path(path):
+    """Codec of archive recognized by its file name suffix"""
+    for codec in sorted(CODECS.values(), key=lambda c: -len(c.suffix)):
+        if str(path).endswith(codec.suffix):
+            return codec
+    raise ValueError(f"Unknown archive type: {path}")
+
+
+class _NoCompressor(object):
+    def compress(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+
+class _LZ4Compressor(object):
+    """Adapts LZ4FrameCompressor to compressobj interface"""
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+        self._header = compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b""
+        return header + self._compressor.compress(data)
+
+    def flush(self):
+        header, self._header = self._header, b""
+        return header + self._compressor.flush()
+
+
+class _CompressingWriter(object):
+    """File-like object compressing data written to it into raw file-like object"""
+
+    def __init__(self, raw, compressor):
+        self._raw = raw
+        self._compressor = compressor
+
+    def write(self, data):
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._raw.write(compressed)
+        return len(data)
+
+    def close(self):
+        self._raw.write(self._compressor.flush())
+
+
+@contextmanager
+def open_archive_stream(raw, codec, level=None):
+    """Opens tar archive in stream mode, compressed with codec and written to raw"""
+    writer = _CompressingWriter(raw, codec.compressor(level))
+    with tarfile.open(fileobj=writer, mode="w|") as tar_file:
+        yield tar_file
+    writer.close()
+
+
+def normalize_tarinfo(tarinfo):
+    """Drops metadata of archive member which does not come from the code: mtime,
+    owner and permissions other than executable bit (as in git)"""
+    tarinfo.mtime = ARCHIVE_MTIME
+    tarinfo.uid = tarinfo.gid = 0
+    tarinfo.uname = tarinfo.gname = ""
+    if not tarinfo.issym():
+        tarinfo.mode = (
+            0o755 if tarinfo.isdir() or tarinfo.mode & stat.S_IXUSR else 0o644
+        )
+    return tarinfo
+
+
+def add_to_archive(tar_file, local_path, arcname):
+    """Adds local_path to archive with normalized metadata; directories are added
+    recursively, in sorted order, so identical trees give identical archives"""
+    tar_file.add(local_path, arcname=arcname, filter=normalize_tarinfo)
+
+
+def read_sample(files, sample_size=SAMPLE_SIZE):
+    """Reads up to sample_size bytes from files; files are (local_path, arcname)"""
+    chunks = []
+    left = sample_size
+    for local_path, _ in files:
+        if left <= 0:
+            break
+        try:
+            with open(local_path, "rb") as f:
+                chunk = f.read(left)
+        except OSError:
+            continue
+        chunks.append(chunk)
+        left -= len(chunk)
+    return b"".join(chunks)
+
+
+def choose_codec(sample, total_size, throughput):
+    """Picks codec minimising estimated time of streaming total_size bytes over link
+    with given throughput (bytes/s); compression speed and ratio are measured on sample
+    at default level of each codec.
+
+    As compression and transfer overlap, time is estimated as the maximum of both.
+    """
+    best, best_time = CODECS["none"], float(total_size) / throughput
+    if not sample:
+        return best
+    for codec in CODECS.values():
+        if codec.name == "none" or not codec.available:
+            continue
+        compressor = codec.compressor()
+        start = time.perf_counter()
+        compressed_size = len(compressor.compress(sample)) + len(compressor.flush())
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        ratio = compressed_size / len(sample)
+        estimated_time = max(
+            total_size / (len(sample) / elapsed), total_size * ratio / throughput
+        )
+        LOGGER.debug(
+            "Codec %s: ratio %.3f, %.1f MB/s, estimated %.2fs",
+            codec.name,
+            ratio,
+            len(sample) / elapsed / 1e6,
+            estimated_time,
+        )
+        if estimated_time < best_time:
+            best, best_time = codec, estimated_time
+    LOGGER.info("Chose %s compression for deployment archive", best.name)
+    return best
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Eviction of sweep directories and cached code archives on the cluster.
+
+Entries (grid directories of sweeps, cached archives with their manifests, shared
+virtualenvs) are evicted least recently used first, until usage of scratch_dir fits
+in byte and inode budget; entries referenced by queued or running jobs are never
+evicted.
+"""
+import re
+
+import attr
+
+GC_PARALLELISM = 8  # remote rm processes
+# file next to job script, listing paths its tasks resolve only when they run
+# (e.g. packed environment), so they count as referenced by the job
+REFS_SUFFIX = ".refs"
+# files of cached archive or virtualenv share name prefix ending with hash
+_CACHE_ENTRY_RE = re.compile(r"^(.*[-/][0-9a-f]{16,64})\.")
+
+
+@attr.s
+class GcEntry(object):
+    path = attr.ib()
+    last_used = attr.ib(default=0)
+    bytes = attr.ib(default=0)
+    inodes = attr.ib(default=0)
+    paths = attr.ib(factory=list)
+
+
+def inventory_cmd(scratch_dir, cache_dir_names, fixed_dir_names):
+    """Command listing usage (tab separated: kind, last use, bytes, inodes, path
+    relative to scratch_dir) of entries under scratch_dir (sweeps and contents of
+    cache_dir_names) and of fixed_dir_names, followed by scripts of user's queued jobs
+    and paths under scratch_dir they (or their refs files) refer to; fails if queued
+    jobs cannot be listed"""
+    cache_dirs = " ".join(f"{name}/*" for name in cache_dir_names)
+    fixed_dirs = " ".join(str(name) for name in fixed_dir_names)
+    return (
+        f"cd {scratch_dir} 2> /dev/null || exit 0; "
+        # without the list of queued jobs nothing is known to be safe to remove
+        "queued=$(squeue -u $USER -h -o %o) || "
+        "{ echo 'Could not list queued jobs' >&2; exit 1; }; "
+        "usage() { printf '%s\\t%s\\t%s\\t%s\\t%s\\n' $1 $2 "
+        '$(du -s --block-size=1 "$3" | cut -f1) $(du -s --inodes "$3" | cut -f1) '
+        '"$3"; }; '
+        f"for p in {cache_dirs}; do "
+        '[ -e "$p" ] && usage entry $(stat -c %Y "$p") "$p"; done; '
+        # files of sweep are written in its subdirectories
+        "for p in */*/; do "
+        '[ -d "$p" ] && usage entry $(find "$p" -maxdepth 2 -printf "%T@\\n" '
+        '| sort -n | tail -n 1 | cut -d. -f1) "${p%/}"; done; '
+        f"for p in {fixed_dirs}; do "
+        '[ -e "$p" ] && usage fixed 0 "$p"; done; '
+        "printf '%s\\n' \"$queued\" | while read -r s; do "
+        '[ -f "$s" ] && printf \'queued\\t%s\\n\' "$s" && '
+        f'grep -ho \'{scratch_dir}/[^ ;|&)]*\' "$s" "$s{REFS_SUFFIX}" 2> /dev/null '
+        "| sed 's/^/ref\\t/'; done; true"
+    )
+
+
+def parse_inventory(output, scratch_dir):
+    """Returns (entries, fixed usage as (bytes, inodes), referenced absolute paths)
+    from output of inventory_cmd; files of cached archive (or virtualenv) are one
+    entry"""
+    entries, fixed, referenced = {}, [0, 0], []
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if fields[0] in ["queued", "ref"] and len(fields) == 2:
+            referenced.append(fields[1])
+        elif fields[0] in ["entry", "fixed"] and len(fields) == 5:
+            kind, last_used, size, inodes, path = fields
+            if kind == "fixed":
+                fixed[0] += int(size)
+                fixed[1] += int(inodes)
+                continue
+            match = _CACHE_ENTRY_RE.match(path)
+            key = match.group(1) if match else path
+            entry = entries.setdefault(key, GcEntry(f"{scratch_dir}/{key}"))
+            entry.last_used = max(entry.last_used, int(last_used))
+            entry.bytes += int(size)
+            entry.inodes += int(inodes)
+            entry.paths.append(path)
+    return list(entries.values()), tuple(fixed), referenced
+
+
+def select_evictions(entries, fixed, referenced, max_bytes=None, max_inodes=None):
+    """Least recently used entries, not referenced, whose removal brings usage
+    within budget (or as close to it, as possible)"""
+    total_bytes = fixed[0] + sum(e.bytes for e in entries)
+    total_inodes = fixed[1] + sum(e.inodes for e in entries)
+    evicted = []
+    for entry in sorted(entries, key=lambda e: e.last_used):
+        if (max_bytes is None or total_bytes <= max_bytes) and (
+            max_inodes is None or total_inodes <= max_inodes
+        ):
+            break
+        if any(
+            path == entry.path
+            or path.startswith(entry.path + ".")
+            or path.startswith(entry.path + "/")
+            for path in referenced
+        ):
+            continue
+        evicted.append(entry)
+        total_bytes -= entry.bytes
+        total_inodes -= entry.inodes
+    return evicted
+
+
+def delete_cmd(scratch_dir):
+    """Command removing paths relative to scratch_dir, NUL-separated on stdin, in
+    parallel; write-protected directories are made writable first. Files are not
+    chmod-ed, as they may be hard links to objects of code store"""
+    return (
+        f"cd {scratch_dir} && xargs -0 -r -n 16 -P {GC_PARALLELISM} "
+        'sh -c \'find "$@" -type d ! -perm -u+w -exec chmod u+w {} + 2> /dev/null; '
+        'rm -rf -- "$@"\' _'
+    )
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""Single file holding configs of all experiments of a sweep.
+
+Fields equal in all configs are stored once, followed by the remaining fields of each
+config and an index of their offsets, so one config is loaded without reading the
+others. Layout (integers are little-endian uint64)::
+
+    magic | number of configs | index offset | shared fields | config 0 | ... | index
+
+Lazy grid pack holds instead one experiment, whose parameters are the base config,
+and the grid of parameters; config is computed from its index when it is read.
+"""
+import copy
+import mmap
+import struct
+
+import cloudpickle
+
+from mrunner.utils.param_grid import as_param_grid
+
+CONFIG_PACK_NAME = "configs.pack"
+MAGIC = b"MRCPACK1"
+GRID_MAGIC = b"MRCGRID1"
+_HEADER = struct.Struct("<8sQQ")
+_OFFSET = struct.Struct("<Q")
+_PICKLE_PROTOCOL = 4
+
+
+def write_config_pack(path, configs):
+    """Writes configs (dicts) into config pack at path"""
+    configs = list(configs)
+    # values are compared by their pickles, as they need not implement equality
+    pickled = [
+        {
+            key: cloudpickle.dumps(value, protocol=_PICKLE_PROTOCOL)
+            for key, value in c.items()
+        }
+        for c in configs
+    ]
+    shared_keys = {
+        key
+        for key, value in (pickled[0].items() if pickled else [])
+        if all(p.get(key) == value for p in pickled[1:])
+    }
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, 0, 0))
+        shared = {key: configs[0][key] for key in shared_keys}
+        f.write(cloudpickle.dumps(shared, protocol=_PICKLE_PROTOCOL))
+        offsets = []
+        for config in configs:
+            offsets.append(f.tell())
+            delta = {k: v for k, v in config.items() if k not in shared_keys}
+            f.write(cloudpickle.dumps(delta, protocol=_PICKLE_PROTOCOL))
+        offsets.append(f.tell())
+        index_offset = f.tell()
+        f.write(b"".join(_OFFSET.pack(offset) for offset in offsets))
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, len(configs), index_offset))
+
+
+def write_grid_pack(path, experiment, params_grid):
+    """Writes lazy grid pack of experiment (dict), with base config as parameters"""
+    with open(path, "wb") as f:
+        f.write(GRID_MAGIC)
+        cloudpickle.dump(
+            {"experiment": experiment, "params_grid": params_grid},
+            f,
+            protocol=_PICKLE_PROTOCOL,
+        )
+
+
+def is_config_pack(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) in [MAGIC, GRID_MAGIC]
+    except OSError:
+        return False
+
+
+def read_config(path, index):
+    """Reads index-th config from config pack; the file is memory-mapped, so only
+    the shared fields and the config itself are read"""
+    with open(path, "rb") as f:
+        if f.read(len(GRID_MAGIC)) == GRID_MAGIC:
+            return _grid_config(cloudpickle.load(f), index)
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        magic, count, index_offset = _HEADER.unpack_from(m, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a config pack")
+        if not 0 <= index < count:
+            raise IndexError(f"Config {index} out of range of {path} ({count} configs)")
+        (shared_end,) = _OFFSET.unpack_from(m, index_offset)
+        start, end = struct.unpack_from("<2Q", m, index_offset + _OFFSET.size * index)
+        config = cloudpickle.loads(m[_HEADER.size : shared_end])
+        config.update(cloudpickle.loads(m[start:end]))
+    return config
+
+
+def _grid_config(grid_pack, index):
+    params_grid = as_param_grid(grid_pack["params_grid"])
+    if not 0 <= index < len(params_grid):
+        raise IndexError(
+            f"Config {index} out of range of grid ({len(params_grid)} configs)"
+        )
+    config = copy.deepcopy(grid_pack["experiment"])
+    config["parameters"].update(params_grid[index])
+    return config
+
+
+def parse_config_ref(ref):
+    """Splits "path:index" reference to config in pack into (path, index); index is
+    None for reference to config file"""
+    path, sep, index = str(ref).rpartition(":")
+    if sep and index.isdigit():
+        return path, int(index)
+    return str(ref), None
@@ -1,16 +1,24 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import logging
 import os
 from subprocess import call
 
 import attr
-from docker.errors import ImageNotFound
+from docker.errors import APIError, ImageNotFound
 from path import Path
 
-from mrunner.utils.utils import GeneratedTemplateFile, get_paths_to_copy
+from mrunner.utils.utils import (
+    GeneratedTemplateFile,
+    get_paths_digest,
+    get_paths_to_copy,
+)
 
 LOGGER = logging.getLogger(__name__)
 
+# label of images holding digest of their build context
+CONTEXT_DIGEST_LABEL = "mrunner.context-digest"
+
 
 class RequirementsFile(object):
 
@@ -37,8 +45,11 @@ class DockerFile(GeneratedTemplateFile):
     def __init__(self, experiment, requirements_file):
         # paths in command shall be relative
         updated_cmd = self._rewrite_paths(experiment.cwd, experiment.cmd.command)
-        paths_to_copy = get_paths_to_copy(
-            exclude=experiment.exclude, paths_to_copy=experiment.paths_to_copy
+        # sorted, so that unchanged context renders the same Dockerfile
+        paths_to_copy = sorted(
+            get_paths_to_copy(
+                exclude=experiment.exclude, paths_to_copy=experiment.paths_to_copy
+            )
         )
         experiment = attr.evolve(
             experiment, cmd=StaticCmd(command=updated_cmd, env=experiment.env)
@@ -50,6 +61,7 @@ class DockerFile(GeneratedTemplateFile):
             requirements_file=requirements_file,
             paths_to_copy=paths_to_copy,
         )
+        self.paths_to_copy = paths_to_copy
 
     def _rewrite_paths(self, cwd, cmd):
         updated_cmd = []
@@ -112,17 +124,32 @@ class DockerEngine(object):
         except ImageNotFound:
             old_image = None
 
-        # build image; use cache if possible
-        LOGGER.debug(Path(dockerfile.path).text())
-        LOGGER.debug("Building docker image")
-        image, _ = self._client.images.build(
-            path=experiment.cwd,
-            tag=repository_name,
-            dockerfile=dockerfile_rel_path,
-            pull=True,
-            rm=True,
-            forcerm=True,
+        # unchanged build context (including base image in registry) gives the same
+        # image, so it is not built again
+        base_image_digest = self._get_base_image_digest(experiment.base_image)
+        context_digest = self._get_context_digest(
+            dockerfile, requirements, base_image_digest
         )
+        if (
+            old_image
+            and base_image_digest
+            and old_image.labels.get(CONTEXT_DIGEST_LABEL) == context_digest
+        ):
+            LOGGER.debug("Build context unchanged, reusing docker image")
+            image = old_image
+        else:
+            # build image; use cache if possible
+            LOGGER.debug(Path(dockerfile.path).text())
+            LOGGER.debug("Building docker image")
+            image, _ = self._client.images.build(
+                path=experiment.cwd,
+                tag=repository_name,
+                dockerfile=dockerfile_rel_path,
+                pull=True,
+                rm=True,
+                forcerm=True,
+                labels={CONTEXT_DIGEST_LABEL: context_digest},
+            )
 
         is_image_updated = not old_image or old_image.id != image.id
         LOGGER.debug("Docker image built (updated={})".format(is_image_updated))
@@ -142,6 +169,23 @@ class DockerEngine(object):
         LOGGER.debug("Docker image {} ready".format(image_name))
         return image_name
 
+    def _get_base_image_digest(self, base_image):
+        """Digest of base image in its registry, which build would pull; None if it
+        cannot be checked"""
+        try:
+            return self._client.images.get_registry_data(base_image).id
+        except APIError as e:
+            LOGGER.debug("Could not check base image %s: %s", base_image, e)
+            return None
+
+    @staticmethod
+    def _get_context_digest(dockerfile, requirements, base_image_digest):
+        digest = hashlib.sha256(get_paths_digest(dockerfile.paths_to_copy).encode())
+        digest.update(Path(dockerfile.path).bytes())
+        digest.update(Path(requirements.path).bytes())
+        digest.update(str(base_image_digest).encode())
+        return digest.hexdigest()
+
     def _generate_requirements_name(self, experiment):
         return "requirements_{}_{}.txt".format(
             experiment.project.replace("/", "_"), experiment.name
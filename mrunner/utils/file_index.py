@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Persistent index of hashes of local files, similar to git's index.
+
+Hash of a file is reused while its size, mtime and inode are unchanged, so digest of
+an unchanged working tree is computed from stat calls only.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from path import Path
+
+LOGGER = logging.getLogger(__name__)
+
+FILE_INDEX_ENV_VAR = "MRUNNER_FILE_INDEX"
+DEFAULT_FILE_INDEX_FILE_NAME = "file_index.sqlite"
+# files modified that recently may change again within mtime resolution without
+# changing their stat, so their hashes are not stored (git's "racy" entries)
+RACY_INTERVAL = 2  # seconds
+HASH_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+QUERY_BATCH_SIZE = 500  # below SQLite's limit of query parameters
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    hash TEXT
+);
+"""
+
+
+def get_default_file_index_path():
+    return Path(
+        os.environ.get(FILE_INDEX_ENV_VAR)
+        or Path(click.get_app_dir("mrunner")) / DEFAULT_FILE_INDEX_FILE_NAME
+    )
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _try_hash(path):
+    try:
+        return hash_file(path)
+    except OSError as e:
+        LOGGER.warning("Skipping %s: %s", str(path), e)
+        return None
+
+
+def _hash_all(paths):
+    with ThreadPoolExecutor(HASH_WORKERS) as executor:
+        return list(executor.map(_try_hash, paths))
+
+
+class FileHashIndex(object):
+    """Maps absolute path of file to (size, mtime, inode, hash); files whose stat
+    changed are re-hashed in a thread pool"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or get_default_file_index_path())
+        self.path.dirname().makedirs_p()
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def hashes(self, paths):
+        """Returns {path: hash} of given files; files which cannot be read are
+        omitted. Paths are expected to be normalized."""
+        stats = {}
+        for path in paths:
+            try:
+                stats[path] = os.stat(path)
+            except OSError as e:
+                LOGGER.warning("Skipping %s: %s", str(path), e)
+        cwd = os.getcwd()
+        keys = {path: os.path.join(cwd, str(path)) for path in stats}
+
+        known = {}
+        key_list = list(keys.values())
+        for i in range(0, len(key_list), QUERY_BATCH_SIZE):
+            batch = key_list[i : i + QUERY_BATCH_SIZE]
+            query = (
+                "SELECT path, size, mtime_ns, inode, hash FROM files "
+                f"WHERE path IN ({', '.join('?' * len(batch))})"
+            )
+            for key, size, mtime_ns, inode, hash_ in self._db.execute(query, batch):
+                known[key] = (size, mtime_ns, inode, hash_)
+
+        result, changed = {}, []
+        for path, st in stats.items():
+            entry = known.get(keys[path])
+            if entry and entry[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+                result[path] = entry[3]
+            else:
+                changed.append(path)
+
+        if changed:
+            LOGGER.debug("Hashing %d changed files", len(changed))
+            hashed = _hash_all(changed)
+            racy_after = (time.time() - RACY_INTERVAL) * 1e9
+            rows = []
+            for path, hash_ in zip(changed, hashed):
+                if hash_ is None:
+                    continue
+                result[path] = hash_
+                st = stats[path]
+                if st.st_mtime_ns < racy_after:
+                    rows.append(
+                        (keys[path], st.st_size, st.st_mtime_ns, st.st_ino, hash_)
+                    )
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows
+                )
+        return result
+
+
+def get_file_hashes(paths):
+    """Hashes of files, as FileHashIndex.hashes, using the default index; if it is not
+    usable, all files are hashed"""
+    paths = list(paths)
+    try:
+        index = FileHashIndex()
+        try:
+            return index.hashes(paths)
+        finally:
+            index.close()
+    except sqlite3.Error as e:
+        LOGGER.warning("Could not use file hash index: %s", e)
+    return {path: h for path, h in zip(paths, _hash_all(paths)) if h is not None}
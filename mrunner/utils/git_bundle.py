@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Shipping code as git bundles against a bare mirror of the project on the cluster.
+
+Only commits the mirror lacks are sent, in a bundle, together with binary diff of
+uncommitted changes (including untracked, not ignored files).
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+LOGGER = logging.getLogger(__name__)
+
+GIT_DIR_NAME = ".git_mirrors"
+# refs of mirror pointing at shipped commits, so they are kept and known
+SHIPPED_REFS = "refs/mrunner"
+
+
+def _git(*args, input=None, env=None):
+    return subprocess.run(
+        ["git", *args],
+        input=input,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ).stdout
+
+
+def get_head(path="."):
+    """Commit checked out in path, if path is root of git working tree"""
+    try:
+        top_level = _git("-C", path, "rev-parse", "--show-toplevel").decode().strip()
+        if os.path.realpath(top_level) != os.path.realpath(path):
+            LOGGER.warning("%s is not root of git repository", os.path.abspath(path))
+            return None
+        return _git("-C", path, "rev-parse", "--verify", "HEAD").decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def known_commits(commits):
+    """Those of commits which are in local repository"""
+    if not commits:
+        return []
+    output = _git(
+        "cat-file", "--batch-check", input="".join(f"{c}\n" for c in commits).encode()
+    )
+    return [
+        line.split()[0]
+        for line in output.decode().splitlines()
+        if line.split()[1:2] == ["commit"]
+    ]
+
+
+def create_bundle(head, remote_commits):
+    """Returns bundle of commits reachable from head and not from remote_commits, or
+    None if there are no such commits"""
+    known = known_commits(remote_commits)
+    # rev-list arguments are passed on stdin, as they may be too many for command line
+    exclude_known = "".join(f"^{c}\n" for c in known).encode()
+    # head may be ancestor of a shipped commit, then mirror has it already
+    if not _git("rev-list", "-n", "1", head, "--stdin", input=exclude_known).strip():
+        return None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bundle_path = os.path.join(tmp_dir, "code.bundle")
+        # bundle needs a ref
+        _git(
+            "bundle",
+            "create",
+            "-q",
+            bundle_path,
+            "HEAD",
+            "--stdin",
+            input=exclude_known,
+        )
+        with open(bundle_path, "rb") as f:
+            return f.read()
+
+
+def diff_working_tree(head, exclude=()):
+    """Binary diff from head to working tree, including untracked files which are
+    not ignored, skipping paths in exclude (relative to root of working tree).
+    Neither user's index nor object database is modified: blobs of new files are
+    written to temporary object directory."""
+    pathspecs = ["--", "."] + [f":(exclude,literal){path}" for path in exclude]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        objects_dir = os.path.join(tmp_dir, "objects")
+        os.mkdir(objects_dir)
+        env = dict(
+            os.environ,
+            GIT_INDEX_FILE=os.path.join(tmp_dir, "index"),
+            GIT_OBJECT_DIRECTORY=objects_dir,
+            GIT_ALTERNATE_OBJECT_DIRECTORIES=os.path.abspath(
+                _git("rev-parse", "--git-path", "objects").decode().strip()
+            ),
+        )
+        index_path = _git("rev-parse", "--git-path", "index").decode().strip()
+        if os.path.exists(index_path):
+            shutil.copy(index_path, env["GIT_INDEX_FILE"])
+        _git("add", "-A", *pathspecs, env=env)
+        return _git("diff", "--cached", "--binary", head, *pathspecs, env=env)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import click
+from path import Path
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_ENV_VAR = "MRUNNER_MANIFEST"
+DEFAULT_MANIFEST_FILE_NAME = "manifest.sqlite"
+SUBMITTED_STATE = "SUBMITTED"
+# states after which job task never changes, so they are not polled anymore
+TERMINAL_STATES = [
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "PREEMPTED",
+    "TIMEOUT",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    unique_name TEXT PRIMARY KEY,
+    project TEXT,
+    name TEXT,
+    cluster TEXT,
+    grid_dir TEXT,
+    submitted REAL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    unique_name TEXT,
+    config_id INTEGER,
+    job_id TEXT,
+    task_id INTEGER,
+    parameters TEXT,
+    task_dir TEXT,
+    log_path TEXT,
+    state TEXT,
+    updated REAL,
+    PRIMARY KEY (unique_name, config_id)
+);
+CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id, task_id);
+"""
+
+
+def get_default_manifest_path():
+    return Path(
+        os.environ.get(MANIFEST_ENV_VAR)
+        or Path(click.get_app_dir("mrunner")) / DEFAULT_MANIFEST_FILE_NAME
+    )
+
+
+class SweepManifest(object):
+    """Local SQLite database of submitted sweeps: job ids, parameters and paths of
+    their configs, together with last known states of the jobs"""
+
+    def __init__(self, path=None):
+        self.path = Path(path or get_default_manifest_path())
+        self.path.dirname().makedirs_p()
+        self._db = sqlite3.connect(self.path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def record_sweep(self, unique_name, project, name, cluster, grid_dir, tasks):
+        """Records sweep; tasks are dicts with config_id, job_id, task_id,
+        parameters, task_dir and log_path of each config. Task without task_id
+        stands for all configs of its job (e.g. of lazy grid)."""
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sweeps VALUES (?, ?, ?, ?, ?, ?)",
+                (unique_name, project, name, cluster, str(grid_dir), time.time()),
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        unique_name,
+                        task["config_id"],
+                        task["job_id"],
+                        task["task_id"],
+                        json.dumps(task["parameters"], default=str, sort_keys=True),
+                        str(task["task_dir"]),
+                        str(task["log_path"]) if task["log_path"] else None,
+                        SUBMITTED_STATE,
+                        0,
+                    )
+                    for task in tasks
+                ],
+            )
+
+    def sweeps(self, unique_names=None):
+        query = "SELECT * FROM sweeps"
+        params = []
+        if unique_names:
+            query += f" WHERE unique_name IN ({', '.join('?' * len(unique_names))})"
+            params = list(unique_names)
+        return self._db.execute(query + " ORDER BY submitted", params).fetchall()
+
+    def tasks(self, unique_name):
+        return self._db.execute(
+            "SELECT * FROM tasks WHERE unique_name = ? ORDER BY config_id",
+            (unique_name,),
+        ).fetchall()
+
+    def stale_jobs(self, unique_names=None, ttl=0):
+        """Returns {cluster: set of job ids} of jobs with tasks not in terminal state,
+        whose state is older than ttl seconds"""
+        query = (
+            "SELECT DISTINCT sweeps.cluster, tasks.job_id FROM tasks "
+            "JOIN sweeps USING (unique_name) "
+            f"WHERE tasks.job_id IS NOT NULL AND tasks.updated < ? "
+            f"AND tasks.state NOT IN ({', '.join('?' * len(TERMINAL_STATES))})"
+        )
+        params = [time.time() - ttl] + TERMINAL_STATES
+        if unique_names:
+            query += f" AND unique_name IN ({', '.join('?' * len(unique_names))})"
+            params += list(unique_names)
+        jobs = {}
+        for cluster, job_id in self._db.execute(query, params):
+            jobs.setdefault(cluster, set()).add(job_id)
+        return jobs
+
+    def update_states(self, job_ids, states):
+        """Stores states, given as {(job_id, task_id): state}, and marks tasks of
+        job_ids as refreshed"""
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "UPDATE tasks SET state = ? WHERE job_id = ? AND task_id = ?",
+                [
+                    (state, job_id, task_id)
+                    for (job_id, task_id), state in states.items()
+                ],
+            )
+            # entries standing for whole job take state of its least advanced task
+            job_states = {}
+            for (job_id, _), state in states.items():
+                job_states.setdefault(job_id, []).append(state)
+            self._db.executemany(
+                "UPDATE tasks SET state = ? WHERE job_id = ? AND task_id IS NULL",
+                [
+                    (_summary_state(job_states[job_id]), job_id)
+                    for job_id in job_ids
+                    if job_id in job_states
+                ],
+            )
+            self._db.executemany(
+                "UPDATE tasks SET updated = ? WHERE job_id = ?",
+                [(now, job_id) for job_id in job_ids],
+            )
+
+
+def _summary_state(states):
+    """State of job from states of its tasks: not finished, failed or completed"""
+    for state in states:
+        if state not in TERMINAL_STATES:
+            return state
+    for state in states:
+        if state != "COMPLETED":
+            return state
+    return "COMPLETED"
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed store of code files on the cluster.
+
+Every file is stored once, under scratch_dir, by its manifest entry (kind and hash,
+see get_files_manifest); a deployment is materialised as hard links to the stored
+objects. Objects no deployment links to have link count 1 and are garbage
+collected.
+"""
+import tarfile
+
+from mrunner.utils.archive import CODECS, normalize_tarinfo, open_archive_stream
+
+OBJECTS_DIR_NAME = ".objects"
+# unreferenced objects younger than that may be just uploaded by concurrent sweep
+GC_MIN_AGE = 60  # minutes
+
+
+def object_name(entry):
+    """Path of object in store, relative to its directory, e.g. f/ab/cdef..."""
+    kind, digest = entry[0], entry[1:]
+    return f"{kind}/{digest[:2]}/{digest[2:]}"
+
+
+def is_stored(entry):
+    """Whether file of manifest entry is kept in store; symlinks are not, and files
+    which could not be read have no hash"""
+    return entry[0] in "fx" and len(entry) > 1
+
+
+def write_links_archive(writer, manifest, tree_dir, objects_dir):
+    """Writes to writer gzipped tar archive materialising manifest as tree_dir, with
+    hard links to objects in objects_dir; both paths are relative to the directory
+    the archive is extracted in"""
+    with open_archive_stream(writer, CODECS["gzip"]) as tar_file:
+        for _, arcname, entry in manifest:
+            tarinfo = tarfile.TarInfo(f"{tree_dir}/{arcname}")
+            if entry[0] == "l":
+                tarinfo.type = tarfile.SYMTYPE
+                tarinfo.linkname = entry[1:]
+            elif is_stored(entry):
+                tarinfo.type = tarfile.LNKTYPE
+                tarinfo.linkname = f"{objects_dir}/{object_name(entry)}"
+            else:
+                continue
+            tar_file.addfile(normalize_tarinfo(tarinfo))
+
+
+def find_missing_cmd(objects_dir):
+    """Command printing those of object names, read from stdin, which are not in
+    store"""
+    return (
+        f"mkdir -p {objects_dir} && cd {objects_dir} && "
+        'while read -r o; do [ -e "$o" ] || echo "$o"; done'
+    )
+
+
+def store_objects_cmd(objects_dir, tar_options):
+    """Command storing objects from archive read from stdin; archive is extracted
+    aside first, so interrupted upload leaves no partial objects in store"""
+    return (
+        f"tmp=$(mktemp -d {objects_dir}/.upload.XXXXXX) && "
+        f"tar -x {tar_options} -f - -C $tmp && "
+        # objects are shared by deployments, none of them may modify it
+        "find $tmp -type f -exec chmod a-w {} + && "
+        f"cp -rlf $tmp/. {objects_dir}/ && rm -rf $tmp"
+    )
+
+
+def gc_objects_cmd(objects_dir):
+    """Command removing objects no deployment links to, and abandoned uploads"""
+    return (
+        f"[ ! -d {objects_dir} ] || ( "
+        f"find {objects_dir} -mindepth 1 -maxdepth 1 -name '.upload.*' "
+        f"-mmin +{GC_MIN_AGE * 24} -exec rm -rf {{}} + ; "
+        f"find {objects_dir} -type f -links 1 -cmin +{GC_MIN_AGE} -print -delete "
+        "| wc -l )"
+    )
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+
+class _SingleGrid(object):
+    """One grid of parameters: product of its values, with keys with "___" suffix
+    iterated together (zipped) in the outer loop"""
+
+    def __init__(self, param_grid):
+        self.empty = not param_grid
+        self.zipped_keys, self.zipped, self.keys, self.grids = [], [], [], []
+        for key, grid in param_grid.items():
+            if "___" in key:
+                self.zipped_keys.append(key[:-3])
+                self.zipped.append(list(grid))
+            else:
+                self.keys.append(key)
+                self.grids.append(list(grid))
+        outer_size = min(len(grid) for grid in self.zipped) if self.zipped else 1
+        self.inner_size = math.prod(len(grid) for grid in self.grids)
+        self.size = 1 if self.empty else outer_size * self.inner_size
+
+    def combination(self, index):
+        if self.empty:
+            return OrderedDict()
+        outer_index, inner_index = divmod(index, self.inner_size)
+        # mixed-radix decomposition of index; product varies the last grid fastest
+        values = []
+        for grid in reversed(self.grids):
+            inner_index, value_index = divmod(inner_index, len(grid))
+            values.append(grid[value_index])
+        values.reverse()
+        zipped_values = [grid[outer_index] for grid in self.zipped]
+        return OrderedDict(zip(self.zipped_keys + self.keys, zipped_values + values))
+
+
+class ParamGrid(Sequence):
+    """Lazy sequence of combinations of parameter grid(s) (dict or list of dicts), in
+    order of get_combinations.
+
+    Combinations are computed from their index on access, so grids too large to be
+    listed can still be indexed, sliced, sampled and filtered; slices, samples and
+    filtered grids are ParamGrid too.
+    """
+
+    def __init__(self, param_grids):
+        if isinstance(param_grids, Mapping):
+            param_grids = [param_grids]
+        self._grids = [_SingleGrid(param_grid) for param_grid in param_grids]
+        self._indices = range(sum(grid.size for grid in self._grids))
+        self._predicate = None
+
+    def _view(self, indices, predicate=None):
+        view = object.__new__(ParamGrid)
+        view._grids = self._grids
+        view._indices = indices
+        view._predicate = predicate
+        return view
+
+    @property
+    def keys(self):
+        """Keys of parameters set by combinations"""
+        return {key for grid in self._grids for key in grid.zipped_keys + grid.keys}
+
+    def _combination(self, index):
+        for grid in self._grids:
+            if index < grid.size:
+                return grid.combination(index)
+            index -= grid.size
+        raise IndexError("ParamGrid index out of range")
+
+    def _resolve(self):
+        # indexing filtered grid requires indices of all matching combinations
+        if self._predicate is not None:
+            predicate, self._predicate = self._predicate, None
+            self._indices = array(
+                "q", (i for i in self._indices if predicate(self._combination(i)))
+            )
+        return self._indices
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __getitem__(self, index):
+        indices = self._resolve()
+        if isinstance(index, slice):
+            return self._view(indices[index])
+        return self._combination(indices[index])
+
+    def __iter__(self):
+        for index in self._indices:
+            combination = self._combination(index)
+            if self._predicate is None or self._predicate(combination):
+                yield combination
+
+    def __repr__(self):
+        if self._predicate is not None:
+            return "ParamGrid(<filtered>)"
+        return f"ParamGrid({len(self)} combinations)"
+
+    def filter(self, predicate):
+        """Combinations for which predicate(combination) is true; predicate is
+        evaluated while iterating, or for all combinations at once when the result
+        is indexed or its length is needed"""
+        if self._predicate is not None:
+            previous = self._predicate
+
+            def _predicate(combination):
+                return previous(combination) and predicate(combination)
+
+        else:
+            _predicate = predicate
+        return self._view(self._indices, _predicate)
+
+    def sample(self, k, seed=None):
+        """k combinations drawn uniformly without replacement, kept in grid order"""
+        indices = self._resolve()
+        chosen = sorted(random.Random(seed).sample(range(len(indices)), k))
+        return self._view(array("q", (indices[i] for i in chosen)))
+
+    def __getstate__(self):
+        # predicate is applied before pickling, so it is not evaluated again on load
+        self._resolve()
+        return self.__dict__
+
+
+def as_param_grid(param_grids):
+    if isinstance(param_grids, ParamGrid):
+        return param_grids
+    return ParamGrid(param_grids)
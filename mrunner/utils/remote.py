@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+import logging
+import sys
+import threading
+
+import attr
+
+LOGGER = logging.getLogger(__name__)
+
+STEP_BEGIN_MARKER = "@@mrunner-step-begin"
+STEP_END_MARKER = "@@mrunner-step-end"
+
+
+class _ChannelWriter(object):
+    """File-like adapter writing to stdin of remote command"""
+
+    def __init__(self, channel):
+        self._channel = channel
+
+    def write(self, data):
+        self._channel.sendall(data)
+        return len(data)
+
+
+def run_with_stdin(connection, cmd, write_stdin, on_stdout_line=None):
+    """Runs cmd remotely; write_stdin is called with file-like object writing
+    directly to its stdin. Returns (exit status, stdout, stderr)."""
+    connection.open()
+    channel = connection.client.get_transport().open_session()
+    output = {"stdout": [], "stderr": []}
+
+    def _read(stream, name, on_line=None):
+        for line in stream:
+            line = line.decode(errors="replace")
+            output[name].append(line)
+            if on_line is not None:
+                on_line(line)
+
+    try:
+        channel.exec_command(cmd)
+        readers = [
+            threading.Thread(
+                target=_read, args=(channel.makefile("rb"), "stdout", on_stdout_line)
+            ),
+            threading.Thread(
+                target=_read, args=(channel.makefile_stderr("rb"), "stderr")
+            ),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            write_stdin(_ChannelWriter(channel))
+        except OSError as e:
+            # remote command exited before reading whole input; exit status tells why
+            LOGGER.debug("Remote command '%s' stopped reading input: %s", cmd, e)
+        channel.shutdown_write()
+        for reader in readers:
+            reader.join()
+        exit_status = channel.recv_exit_status()
+    finally:
+        channel.close()
+    return exit_status, "".join(output["stdout"]), "".join(output["stderr"])
+
+
+class RemoteBatchError(RuntimeError):
+    """Failure of remote batch; results holds StepResult of every step, exited is
+    None for steps which did not finish"""
+
+    def __init__(self, message, results):
+        super(RemoteBatchError, self).__init__(message)
+        self.results = results
+
+
+@attr.s
+class StepResult(object):
+    name = attr.ib()
+    cmd = attr.ib()
+    exited = attr.ib(default=None)
+    stdout = attr.ib(default="")
+    started = attr.ib(default=False)
+
+    @property
+    def ok(self):
+        return self.exited == 0
+
+
+@attr.s
+class _Step(object):
+    name = attr.ib()
+    cmd = attr.ib()
+    warn = attr.ib(default=False)
+    echo = attr.ib(default=False)
+    payload = attr.ib(default=None)
+    write_stdin = attr.ib(default=None)
+
+
+class RemoteBatch(object):
+    """Collects remote shell steps and runs them in a single SSH round-trip.
+
+    Steps are executed in order by one remote `bash`, which stops at the first failed
+    step (unless added with warn=True); exit code and output of each step are reported.
+    Inputs of steps (e.g. file contents) are sent through stdin of the same
+    invocation, after the script itself. At most one streaming step is allowed, as it
+    consumes the rest of stdin.
+    """
+
+    def __init__(self):
+        self._steps = []
+
+    def __len__(self):
+        return len(self._steps)
+
+    def add(self, name, cmd, warn=False, echo=False):
+        """Adds step running cmd; with echo=True its output is printed live"""
+        self._steps.append(_Step(name, cmd, warn=warn, echo=echo))
+
+    def add_with_input(self, name, cmd, payload):
+        """Adds step running cmd with payload bytes on its stdin"""
+        self._check_no_stream()
+        self._steps.append(_Step(name, cmd, payload=payload))
+
+    def add_file(self, name, remote_path, content, mode=None):
+        """Adds step writing content to remote_path"""
+        cmd = f"cat > {remote_path}"
+        if mode:
+            cmd += f" && chmod {mode} {remote_path}"
+        self.add_with_input(name, cmd, content)
+
+    def add_stream(self, name, cmd, write_stdin):
+        """Adds step running cmd reading data written by write_stdin(file_like) while
+        it is produced"""
+        self._check_no_stream()
+        self._steps.append(_Step(name, cmd, write_stdin=write_stdin))
+
+    def _check_no_stream(self):
+        if any(step.write_stdin for step in self._steps):
+            raise ValueError("No step reading input may follow streaming step")
+
+    @property
+    def script(self):
+        lines = ["__mrunner_batch() {"]
+        for idx, step in enumerate(self._steps):
+            if step.payload is not None:
+                cmd = f"head -c {len(step.payload)} | ( {step.cmd} ) 2>&1"
+            elif step.write_stdin is not None:
+                cmd = f"( {step.cmd} ) 2>&1"
+            else:
+                cmd = f"( {step.cmd} ) < /dev/null 2>&1"
+            lines += [
+                f"echo {STEP_BEGIN_MARKER} {idx}",
+                cmd,
+                "__rc=$?",
+                f"printf '\\n{STEP_END_MARKER} {idx} %d\\n' $__rc",
+            ]
+            if not step.warn:
+                lines.append("[ $__rc -eq 0 ] || return $__rc")
+        lines += ["}", "__mrunner_batch; exit $?", ""]
+        return "\n".join(lines)
+
+    def run(self, connection):
+        """Runs all steps; returns dict of StepResult by step name and raises
+        RemoteBatchError if any step failed without warn=True"""
+        script = self.script
+        for step in self._steps:
+            LOGGER.info("SSH: batching command [%s] '%s'", step.name, step.cmd)
+
+        def _write_stdin(writer):
+            writer.write(script.encode("utf-8"))
+            for step in self._steps:
+                if step.payload is not None:
+                    writer.write(step.payload)
+                elif step.write_stdin is not None:
+                    step.write_stdin(writer)
+
+        parser = _OutputParser(self._steps)
+        try:
+            exit_status, _, stderr = run_with_stdin(
+                connection, "bash -s", _write_stdin, on_stdout_line=parser.feed
+            )
+        except Exception as e:
+            # e.g. connection lost; steps reported so far are known to have run
+            raise RemoteBatchError(f"Remote batch failed: {e}", parser.results) from e
+        results = parser.results
+        for step, result in zip(self._steps, results.values()):
+            if result.exited is None:
+                raise RemoteBatchError(
+                    f"Remote batch exited with code {exit_status} before "
+                    f"[{step.name}] '{step.cmd}' finished: {stderr}",
+                    results,
+                )
+            if not result.ok and not step.warn:
+                raise RemoteBatchError(
+                    f"Command [{step.name}] '{step.cmd}' failed with exit code "
+                    f"{result.exited}:\n{result.stdout}",
+                    results,
+                )
+        return results
+
+
+class _OutputParser(object):
+    """Splits output of batch script into outputs of its steps"""
+
+    def __init__(self, steps):
+        self._steps = steps
+        self._current = None
+        self.results = {
+            step.name: StepResult(step.name, step.cmd) for step in self._steps
+        }
+        self._outputs = {step.name: [] for step in self._steps}
+
+    def feed(self, line):
+        if line.startswith(STEP_BEGIN_MARKER):
+            self._current = self._steps[int(line.split()[1])]
+            self.results[self._current.name].started = True
+            return
+        if line.startswith(STEP_END_MARKER):
+            _, idx, exited = line.split()
+            step = self._steps[int(idx)]
+            result = self.results[step.name]
+            result.exited = int(exited)
+            # drop newline printed before the marker
+            result.stdout = "".join(self._outputs[step.name])[:-1]
+            if step.echo and self._outputs[step.name]:
+                self._echo(self._outputs[step.name][-1][:-1])
+            self._current = None
+            return
+        if self._current is None:
+            return
+        outputs = self._outputs[self._current.name]
+        if self._current.echo and outputs:
+            # lines are echoed with one line delay, to skip newline before the marker
+            self._echo(outputs[-1])
+        outputs.append(line)
+
+    @staticmethod
+    def _echo(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
@@ -1,4 +1,6 @@
+import hashlib
 import logging
+import os
 import re
 from collections import OrderedDict, namedtuple
 from tempfile import NamedTemporaryFile
@@ -10,14 +12,27 @@ from jinja2 import Environment, PackageLoader, StrictUndefined
 from path import Path
 
 from mrunner.backends import get_context_cls
+from mrunner.utils.config_pack import CONFIG_PACK_NAME
+from mrunner.utils.file_index import get_file_hashes
 
 LOGGER = logging.getLogger(__name__)
 
+MEM_UNITS = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
 
 def pathify(path, separator="-"):
     return re.sub(r"[ ]+", separator, path.lower())
 
 
+def parse_mem(mem):
+    """Converts memory in Slurm notation (e.g. "512M", "8G"; megabytes by default)
+    into bytes"""
+    mem = str(mem).strip().upper().rstrip("B")
+    if mem and mem[-1] in MEM_UNITS:
+        return int(float(mem[:-1]) * MEM_UNITS[mem[-1]])
+    return int(float(mem) * MEM_UNITS["M"])
+
+
 def parse_argv(parser, argv):
     try:
         divider_pos = argv.index("--")
@@ -67,6 +82,11 @@ class WrapperCmd(object):
     _cmd = attr.ib()
     _experiment_config_path = attr.ib()
 
+    @property
+    def config_pack(self):
+        """Whether configs are in one config pack, rather than file per config"""
+        return Path(self._experiment_config_path).name == CONFIG_PACK_NAME
+
     @property
     def command(self):
         cmd = (
@@ -74,11 +94,38 @@ class WrapperCmd(object):
             if isinstance(self._cmd, six.string_types)
             else self._cmd
         )
-        config_argv = ["--config", "config_$SLURM_ARRAY_TASK_ID"]
+        if self.config_pack:
+            config_argv = ["--config", f"{CONFIG_PACK_NAME}:$MRUNNER_CONFIG_ID"]
+        else:
+            config_argv = ["--config", "config_$MRUNNER_CONFIG_ID"]
         cmd = cmd + config_argv
         return " ".join(cmd)
 
 
+_EXCLUDED = object()
+
+
+def _build_exclude_tree(exclude):
+    """Compiles excluded paths into tree of path components relative to current
+    working directory; _EXCLUDED marks excluded subtree, other nodes contain excluded
+    descendants. Paths outside current working directory are skipped."""
+    cwd = Path(".").abspath()
+    tree = {}
+    for e in exclude:
+        rel = Path(e).abspath().relpath(cwd)
+        if rel == "." or rel.startswith(".."):
+            continue
+        node = tree
+        *parents, name = rel.splitall()[1:]
+        for parent in parents:
+            node = node.setdefault(parent, {})
+            if node is _EXCLUDED:
+                break
+        else:
+            node[name] = _EXCLUDED
+    return tree
+
+
 def get_paths_to_copy(paths_to_copy=None, exclude=None):
     """Lists paths to copy from current working directory, after excluding paths from exclude list;
     additionally paths_to_copy are copied"""
@@ -87,26 +134,21 @@ def get_paths_to_copy(paths_to_copy=None, exclude=None):
         paths_to_copy = []
     if exclude is None:
         exclude = [".git", ".gitignore", ".gitmodules"]
-    exclude = [Path(e).abspath() for e in exclude]
+    exclude_tree = _build_exclude_tree(exclude)
 
-    def _list_dir(d):
+    def _list_dir(d, tree):
         directories = []
-        for p in Path(d).listdir():
-            p = p.abspath()
-            excluded = False
-            for e in exclude:
-                e = Path(e).abspath()
-                if not e.relpath(p).startswith(".."):
-                    excluded = True
-                    # if excluded subdir - not whole current
-                    if e != p:
-                        directories += _list_dir(p)
-                    break
-            if not excluded:
-                directories.append(PathToDump(p.relpath("."), p.relpath(".")))
+        for name in os.listdir(d or "."):
+            p = os.path.join(d, name)
+            subtree = tree.get(name)
+            if subtree is None:
+                directories.append(PathToDump(Path(p), Path(p)))
+            elif subtree is not _EXCLUDED:
+                # if excluded subdir - not whole current
+                directories += _list_dir(p, subtree)
         return directories
 
-    result = _list_dir(Path("."))
+    result = _list_dir("", exclude_tree)
     for external in paths_to_copy:
         if ":" in external:
             src, rel_dst = external.split(":")
@@ -132,6 +174,73 @@ def get_paths_to_copy(paths_to_copy=None, exclude=None):
     return result
 
 
+def _list_files_to_dump(paths_to_dump):
+    """(local_path, arcname) as str, of files listed by iter_files_to_dump"""
+
+    def _walk(local_path, arcname):
+        if os.path.isdir(local_path) and not os.path.islink(local_path):
+            with os.scandir(local_path) as entries:
+                names = sorted(entry.name for entry in entries)
+            for name in names:
+                yield from _walk(
+                    os.path.join(local_path, name), os.path.join(arcname, name)
+                )
+        else:
+            yield arcname, local_path
+
+    items = []
+    for p in paths_to_dump:
+        items.extend(_walk(str(p.local_path), str(p.rel_remote_path)))
+    items.sort()
+    return [(local_path, arcname) for arcname, local_path in items]
+
+
+def iter_files_to_dump(paths_to_dump):
+    """Lists (local_path, arcname) of every file and symlink covered by paths_to_dump,
+    descending into directories; entries are sorted by arcname"""
+    return [
+        (Path(local_path), Path(arcname))
+        for local_path, arcname in _list_files_to_dump(paths_to_dump)
+    ]
+
+
+def get_files_manifest(paths_to_dump):
+    """Lists (local_path, arcname, entry) of files listed by iter_files_to_dump; entry
+    describes content of file: "f" or "x" (executable) followed by its hash, or "l"
+    followed by target of symlink. Hashes of files are kept in persistent index, so
+    only files changed since the last call are read."""
+    files = _list_files_to_dump(paths_to_dump)
+    links = {local_path for local_path, _ in files if os.path.islink(local_path)}
+    file_hashes = get_file_hashes(
+        [local_path for local_path, _ in files if local_path not in links]
+    )
+    manifest = []
+    for local_path, arcname in files:
+        if local_path in links:
+            entry = "l" + os.readlink(local_path)
+        else:
+            entry = ("x" if os.access(local_path, os.X_OK) else "f") + file_hashes.get(
+                local_path, ""
+            )
+        manifest.append((local_path, arcname, entry))
+    return manifest
+
+
+def get_manifest_digest(manifest):
+    """Content hash of files listed in manifest, see get_files_manifest"""
+    digest = hashlib.sha256()
+    for _, arcname, entry in manifest:
+        digest.update(arcname.encode("utf-8") + b"\0")
+        digest.update(entry.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def get_paths_digest(paths_to_dump):
+    """Content hash of the files selected by get_paths_to_copy; identical trees give
+    identical digests regardless of timestamps"""
+    return get_manifest_digest(get_files_manifest(paths_to_dump))
+
+
 def make_attr_class(class_name, fields, **class_kwargs):
     fields = OrderedDict(
         [
@@ -44,5 +44,6 @@ setup(
     extras_require={
         "dev": ["black", "isort", "pre-commit"],
         "doc": ["sphinx-rtd-theme", "sphinx", "myst_parser"],
+        "compression": ["zstandard", "lz4"],
     },
 )